@@ -0,0 +1,122 @@
+import argparse
+import atexit
+import collections
+import contextlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Append-only history of graded attempts in SQLite. record() only appends to an in-memory buffer, so
+# a submit never waits on disk; a daemon thread drains the buffer in batches, one transaction each.
+# The (category, is_correct) index keeps per-category accuracy an index-only scan at millions of rows;
+# (recorded_at, category, is_correct) does the same for a time window (--since-hours).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attempts (
+    id INTEGER PRIMARY KEY,
+    recorded_at REAL NOT NULL,
+    session_id TEXT,
+    category TEXT NOT NULL,
+    from_unit TEXT NOT NULL,
+    to_unit TEXT NOT NULL,
+    start_value REAL NOT NULL,
+    sequence TEXT NOT NULL,
+    status TEXT NOT NULL,
+    is_correct INTEGER NOT NULL,
+    latency_ms REAL
+);
+CREATE INDEX IF NOT EXISTS attempts_category_correct ON attempts (category, is_correct);
+CREATE INDEX IF NOT EXISTS attempts_recent_category_correct ON attempts (recorded_at, category, is_correct);
+CREATE INDEX IF NOT EXISTS attempts_session ON attempts (session_id, recorded_at);
+"""
+ATTEMPT_COLUMNS = ("recorded_at", "session_id", "category", "from_unit", "to_unit", "start_value", "sequence", "status", "is_correct", "latency_ms")
+CLOSE_TIMEOUT = 5.0 # Longest close() (and so interpreter exit) waits for the last batches
+_LOGGER = logging.getLogger(__name__)
+_INSERT_SQL = f"INSERT INTO attempts ({', '.join(ATTEMPT_COLUMNS)}) VALUES ({', '.join('?' * len(ATTEMPT_COLUMNS))})"
+
+def _connect(path):
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+class AttemptLog:
+    def __init__(self, path, batch_size=500, flush_interval=1.0, max_buffered=100000):
+        self.path, self.batch_size, self.flush_interval = path, batch_size, flush_interval
+        self.dropped = 0 # Attempts discarded because the buffer was full (disk stalled for too long) or the log was closed
+        self.failed = 0 # Attempts lost because their batch could not be written
+        self._buffer, self._max_buffered = collections.deque(), max_buffered
+        self._flush_requested, self._flushed, self._closed, self._writing = threading.Event(), threading.Condition(), False, False
+        with contextlib.closing(_connect(path)) as connection: connection.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._write_loop, name="attempt-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close) # Don't lose the last partial batch on shutdown
+
+    def record(self, session_id, category, from_unit, to_unit, start_value, sequence, status, is_correct, latency_ms=None):
+        """Queue one attempt. `sequence` is the submitted steps as text, e.g. "× 10 × 100"."""
+        if self._closed or len(self._buffer) >= self._max_buffered: self.dropped += 1; return
+        self._buffer.append((time.time(), session_id, category, from_unit, to_unit, start_value, sequence, status, int(bool(is_correct)), latency_ms))
+        if len(self._buffer) >= self.batch_size: self._flush_requested.set()
+
+    def flush(self, timeout=None):
+        """Block until everything queued before this call is on disk."""
+        with self._flushed:
+            self._flush_requested.set()
+            return self._flushed.wait_for(lambda: not self._buffer and not self._writing, timeout)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        if self._closed: return
+        self.flush(timeout)
+        self._closed = True
+        self._flush_requested.set()
+        self._writer.join(timeout)
+
+    def _write_loop(self):
+        connection = _connect(self.path)
+        try:
+            while True:
+                self._flush_requested.wait(self.flush_interval)
+                self._flush_requested.clear()
+                with self._flushed: self._writing = True
+                try:
+                    while self._buffer:
+                        rows = [self._buffer.popleft() for _ in range(min(len(self._buffer), self.batch_size))]
+                        try:
+                            with connection: connection.executemany(_INSERT_SQL, rows)
+                        except Exception: # A bad batch or a full disk must not stop the writer
+                            self.failed += len(rows)
+                            _LOGGER.exception("Could not write %d attempts to %s", len(rows), self.path)
+                finally:
+                    with self._flushed:
+                        self._writing = False
+                        self._flushed.notify_all()
+                if self._closed: return
+        finally:
+            connection.close()
+
+def category_accuracy(path, since=None):
+    """[(category, attempts, correct, accuracy)] over all attempts, or those recorded at/after `since`."""
+    query, params = "SELECT category, COUNT(*), SUM(is_correct) FROM attempts", ()
+    with contextlib.closing(_connect(path)) as connection:
+        if since is not None:
+            # Left alone, SQLite scans the category index to skip the GROUP BY sort even for a one-hour window.
+            # Logs last opened by an older app lack the index (AttemptLog adds it); they just scan.
+            has_index = connection.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'attempts_recent_category_correct'").fetchone()
+            query, params = query + (" INDEXED BY attempts_recent_category_correct" if has_index else "") + " WHERE recorded_at >= ?", (since,)
+        rows = connection.execute(query + " GROUP BY category ORDER BY category", params).fetchall()
+    return [(category, attempts, correct, correct / attempts) for category, attempts, correct in rows]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-category accuracy from an attempt log.")
+    parser.add_argument("path", help="SQLite attempt log written by the app")
+    parser.add_argument("--since-hours", type=float, help="Only count attempts from the last N hours")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.path): parser.error(f"no attempt log at {args.path}")
+    since = None if args.since_hours is None else time.time() - args.since_hours * 3600
+    print(f"{'category':<22} {'attempts':>10} {'correct':>10} {'accuracy':>9}")
+    for category, attempts, correct, accuracy in category_accuracy(args.path, since):
+        print(f"{category:<22} {attempts:>10} {correct:>10} {accuracy:>9.1%}")
+
+if __name__ == "__main__":
+    main()
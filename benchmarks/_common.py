@@ -0,0 +1,69 @@
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(REPO_ROOT, "streamlit_app.py")
+if REPO_ROOT not in sys.path: sys.path.insert(0, REPO_ROOT)
+
+def quiet_streamlit():
+    # Bare-mode runs (no `streamlit run`) log a "missing ScriptRunContext" warning per st.* call
+    # AppTest resets log levels from config on every run, so the warning is filtered out instead
+    import streamlit.config
+    import streamlit.logger
+    streamlit.config.set_option("global.showWarningOnDirectExecution", False)
+    streamlit.logger.set_log_level(logging.ERROR)
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(
+        lambda record: "missing ScriptRunContext" not in record.getMessage())
+
+def percentile(sorted_samples, pct):
+    if not sorted_samples: return float("nan")
+    index = min(len(sorted_samples) - 1, max(0, round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+def summarize(name, samples_s, wall_s=None, peak_bytes=None):
+    """Latency summary for a list of per-operation timings in seconds."""
+    samples = sorted(samples_s)
+    total = wall_s if wall_s is not None else sum(samples)
+    return {
+        "name": name, "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1e3, "p99_ms": percentile(samples, 99) * 1e3,
+        "ops_per_s": len(samples) / total if total else float("nan"),
+        "peak_kib": None if peak_bytes is None else peak_bytes / 1024,
+    }
+
+def print_summaries(summaries):
+    print(f"{'benchmark':<34} {'count':>8} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>12} {'peak KiB':>10}")
+    for s in summaries:
+        peak = "-" if s["peak_kib"] is None else f"{s['peak_kib']:.1f}"
+        print(f"{s['name']:<34} {s['count']:>8} {s['p50_ms']:>10.4f} {s['p99_ms']:>10.4f} {s['ops_per_s']:>12.1f} {peak:>10}")
+
+def time_calls(fn, count):
+    samples = []
+    for _ in range(count):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def peak_allocation(fn, count):
+    """Mean peak bytes allocated by one call of fn, as traced by tracemalloc."""
+    total = 0
+    tracemalloc.start()
+    try:
+        for _ in range(count):
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            total += max(0, peak - before)
+    finally:
+        tracemalloc.stop()
+    return total / count
+
+def check_p99(summaries, max_p99_ms):
+    """Return the names of benchmarks whose p99 exceeds the budget, for use as a CI gate."""
+    if max_p99_ms is None: return []
+    return [s["name"] for s in summaries if s["p99_ms"] > max_p99_ms]
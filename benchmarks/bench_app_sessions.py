@@ -0,0 +1,95 @@
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from _common import APP_PATH, check_p99, peak_allocation, print_summaries, quiet_streamlit, summarize
+
+quiet_streamlit()
+os.environ["UNIT_APP_ATTEMPT_LOG"] = "" # Don't write an attempt log from the benchmark
+
+from streamlit.testing.v1 import AppTest
+
+# Headless load test: each simulated student is an AppTest session (no browser, no network) that
+# answers questions by clicking operation/factor buttons, sometimes removing a step, pressing "=" and
+# asking for a new question. Every .run() is one rerun; its wall time is the recorded latency.
+# AppTest manages a process-global runtime, so sessions within a worker process are interleaved one
+# rerun at a time (as a busy server would schedule them) and parallelism comes from worker processes.
+SUBMIT_KEY, NEW_QUESTION_KEY = "submit_equals_button_main_line_v8", "new_q_btn_bottom_v8"
+
+def _timed_run(app_test):
+    started = time.perf_counter()
+    app_test.run()
+    if app_test.exception: raise RuntimeError(app_test.exception[0].value)
+    return time.perf_counter() - started
+
+def _click(app_test, key):
+    app_test.button(key=key).click()
+    return _timed_run(app_test)
+
+def simulate_student(session_index, questions, timeout):
+    """Generator yielding the latency of each rerun one student session triggers."""
+    rng = random.Random(session_index)
+    app_test = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    yield _timed_run(app_test)
+    if session_index % 2: # Half the class works in scientific notation
+        app_test.toggle(key="sci_notation_toggle_widget").set_value(True)
+        yield _timed_run(app_test)
+    for _ in range(questions):
+        option_keys = [b.key for b in app_test.button if b.key.startswith("avail_")]
+        op_keys = [k for k in option_keys if k.startswith("avail_op_")]
+        factor_keys = [k for k in option_keys if k.startswith("avail_factor_")]
+        for _ in range(rng.randint(1, 3)):
+            yield _click(app_test, rng.choice(op_keys))
+            yield _click(app_test, rng.choice(factor_keys))
+        if rng.random() < 0.3: # Change of mind: drop the last factor and pick another
+            yield _click(app_test, f"rem_btn_seq_{len(app_test.session_state.student_sequence) - 1}")
+            yield _click(app_test, rng.choice(factor_keys))
+        yield _click(app_test, SUBMIT_KEY)
+        yield _click(app_test, NEW_QUESTION_KEY)
+
+def run_worker(session_indices, questions, timeout=30):
+    quiet_streamlit()
+    active = [simulate_student(i, questions, timeout) for i in session_indices]
+    samples = []
+    while active:
+        for session in list(active):
+            try: samples.append(next(session))
+            except StopIteration: active.remove(session)
+    return samples
+
+def run_load(sessions, questions, processes):
+    started = time.perf_counter()
+    shards = [list(range(sessions))[p::processes] for p in range(processes)]
+    if processes == 1:
+        samples = run_worker(shards[0], questions)
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            samples = [s for shard_samples in pool.map(run_worker, shards, [questions] * processes) for s in shard_samples]
+    return samples, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless multi-session load test for streamlit_app.main.")
+    parser.add_argument("--sessions", type=int, default=8, help="Simulated students")
+    parser.add_argument("--questions", type=int, default=5, help="Questions answered per student")
+    parser.add_argument("--processes", type=int, default=1, help="Worker processes sharing the sessions")
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if rerun p99 exceeds this")
+    args = parser.parse_args(argv)
+
+    samples, wall_s = run_load(args.sessions, args.questions, args.processes)
+    # Allocations are traced separately on one short in-process session, since tracing slows every rerun
+    traced_samples = []
+    session_peak = peak_allocation(lambda: traced_samples.extend(run_worker([0], 1)), 1)
+    summaries = [summarize(f"rerun ({args.sessions} sessions/{args.processes}p)", samples, wall_s),
+                 summarize("rerun (1 traced session)", traced_samples, peak_bytes=session_peak)]
+    print_summaries(summaries)
+    failed = check_p99(summaries, args.max_p99_ms)
+    if failed:
+        print(f"p99 over {args.max_p99_ms} ms: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import argparse
+import os
+import sys
+
+from _common import check_p99, peak_allocation, print_summaries, quiet_streamlit, summarize, time_calls
+
+quiet_streamlit()
+os.environ["UNIT_APP_ATTEMPT_LOG"] = "" # Don't write an attempt log from the benchmark
+
+import streamlit as st
+
+import conversion_core as core
+import streamlit_app as app
+
+# Micro-benchmarks for the functions every rerun or click goes through. The Streamlit-facing ones
+# (generate_question, on_submit_button_clicked) run in bare mode against a plain st.session_state.
+def _submit_once():
+    cqd = st.session_state.current_question_data
+    op = "÷" if cqd.operation_per_step_correct == "÷" else "×"
+    st.session_state.student_sequence = core.new_step_sequence(core.encode_step(step) for step in (op, 10, op, 100))
+    app.on_submit_button_clicked()
+
+def _cases():
+    submission = core.generate_question_batch(10000, seed=0)
+    seqs = [["×", 1000]] * 10000
+    mastery = core.MasteryScheduler()
+    km_to_cm = core.CompactQuestion(next(i for i, c in enumerate(core.FLAT_CONVERSION_PAIRS) if (c["from"], c["to"]) == ("km", "cm")), 2.5, 250000.0)
+    km_to_cm_codes = core.new_step_sequence(core.encode_step(step) for step in ("×", 1000, "×", 100))
+    return [
+        ("generate_question", app.generate_question),
+        ("generate_question_batch(10k)", lambda: core.generate_question_batch(10000)),
+        ("format_number_display", lambda: core.format_number_display(12345.678, False)),
+        ("format_number_display sci", lambda: core.format_number_display(12345.678, True)),
+        ("format_number_display uncached", lambda: core._format_number_display_uncached(12345.678, True)),
+        ("mastery update + sample", lambda: mastery.update(mastery.sample(), False)),
+        ("get_current_available_steps", lambda: core.get_current_available_steps(True)),
+        ("grade_sequence", lambda: core.grade_sequence(2.5, 2500.0, ["×", 10, "×", 100])),
+        ("grade_step_codes", lambda: core.grade_step_codes(km_to_cm, km_to_cm_codes)),
+        ("on_submit_button_clicked", _submit_once),
+        ("grade_sequences_batch(10k)", lambda: core.grade_sequences_batch(submission["start_value_raw"], submission["correct_answer_raw"], seqs)),
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for streamlit_app hot paths.")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any benchmark's p99 exceeds this")
+    args = parser.parse_args(argv)
+
+    app.init_session_state()
+    app.generate_question()
+    summaries = []
+    for name, fn in _cases():
+        iterations = max(1, args.iterations // 100) if "(10k)" in name else args.iterations
+        fn() # Warm caches the same way a running server would have them
+        samples = time_calls(fn, iterations)
+        summaries.append(summarize(name, samples, peak_bytes=peak_allocation(fn, min(iterations, 50))))
+    print_summaries(summaries)
+    failed = check_p99(summaries, args.max_p99_ms)
+    if failed:
+        print(f"p99 over {args.max_p99_ms} ms: {', '.join(failed)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
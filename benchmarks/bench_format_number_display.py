@@ -0,0 +1,48 @@
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from conversion_core import (
+    SCI_FACTORS_MAP, STANDARD_FACTORS_VALUES, _format_number_display_uncached,
+    format_number_array, format_number_display,
+)
+
+# Mimics one rerun: the question's start value and result, the sequence buttons and every factor button,
+# formatted in both modes. Compares the cached formatter with the uncached implementation it wraps.
+def _rerun_workload(seed=0):
+    rng = np.random.default_rng(seed)
+    start_values = list(rng.uniform(0.01, 5000, 20))
+    factors = [*STANDARD_FACTORS_VALUES, *SCI_FACTORS_MAP]
+    calls = []
+    for start_value in start_values:
+        for sci_on in (False, True):
+            calls.append((start_value, sci_on, False))
+            calls.append((start_value * 1000, sci_on, False))
+            calls.extend((factor, sci_on, True) for factor in factors)
+            calls.extend(("×", sci_on, True) for _ in range(3))
+    return calls
+
+def _run(formatter, calls, repeat):
+    for _ in range(repeat):
+        for call in calls: formatter(*call)
+
+def main(repeat=200):
+    calls = _rerun_workload()
+    total_calls = len(calls) * repeat
+    uncached = min(timeit.repeat(lambda: _run(_format_number_display_uncached, calls, repeat), number=1, repeat=5))
+    cached = min(timeit.repeat(lambda: _run(format_number_display, calls, repeat), number=1, repeat=5))
+    print(f"format_number_display uncached: {uncached / total_calls * 1e6:.3f} µs/call")
+    print(f"format_number_display cached:   {cached / total_calls * 1e6:.3f} µs/call ({uncached / cached:.1f}x faster)")
+
+    values = np.round(np.random.default_rng(1).uniform(0.01, 5000, 100000), 2)
+    scalar = min(timeit.repeat(lambda: [_format_number_display_uncached(float(v)) for v in values], number=1, repeat=3))
+    vectorized = min(timeit.repeat(lambda: format_number_array(values), number=1, repeat=3))
+    print(f"format 100k values, scalar loop:        {scalar * 1e3:.1f} ms")
+    print(f"format 100k values, format_number_array: {vectorized * 1e3:.1f} ms ({scalar / vectorized:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
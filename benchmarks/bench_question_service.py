@@ -0,0 +1,86 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from _common import REPO_ROOT, check_p99, print_summaries, summarize
+
+import conversion_core as core
+from question_service import LocalQuestionService, QuestionServiceClient
+
+# Load test for question_service.py. --clients processes stand in for Streamlit server processes, each
+# with --threads concurrent sessions that ask for a question and submit the shortest correct answer,
+# --requests times. The same load is run against a started service (shared pool, batched) and against
+# LocalQuestionService in every client process, which is what each Streamlit process does without it.
+def _session(service, requests, seed, samples):
+    rng = random.Random(seed)
+    for _ in range(requests):
+        started = time.perf_counter()
+        question = service.generate(pair_index=rng.randrange(len(core.FLAT_CONVERSION_PAIRS)))[0]
+        generated = time.perf_counter()
+        solution = core.step_solution(question.pair_index, False)
+        service.grade(question, [core.encode_step(token) for op, factor, _ in solution for token in (op, factor)])
+        samples["generate"].append(generated - started)
+        samples["grade"].append(time.perf_counter() - generated)
+
+def _client_process(path, threads, requests, client_index):
+    service = QuestionServiceClient(path) if path else LocalQuestionService()
+    samples = {"generate": [], "grade": []}
+    sessions = [threading.Thread(target=_session, args=(service, requests, client_index * threads + i, samples)) for i in range(threads)]
+    for session in sessions: session.start()
+    for session in sessions: session.join()
+    service.close()
+    return samples
+
+def _run_load(path, args):
+    samples = {"generate": [], "grade": []}
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.clients) as executor:
+        for client_samples in executor.map(_client_process, [path] * args.clients, [args.threads] * args.clients, [args.requests] * args.clients, range(args.clients)):
+            for name, timings in client_samples.items(): samples[name].extend(timings)
+    return samples, time.perf_counter() - started
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test for the shared question service.")
+    parser.add_argument("--clients", type=int, default=4, help="Client processes (Streamlit servers)")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent sessions per client process")
+    parser.add_argument("--requests", type=int, default=200, help="Question + submit round trips per session")
+    parser.add_argument("--workers", type=int, default=2, help="Service worker processes")
+    parser.add_argument("--batch-window-ms", type=float, default=2.0)
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any benchmark's p99 exceeds this")
+    args = parser.parse_args(argv)
+
+    summaries = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "question_service.sock")
+        server = subprocess.Popen([sys.executable, os.path.join(REPO_ROOT, "question_service.py"), path,
+                                   "--workers", str(args.workers), "--batch-window-ms", str(args.batch_window_ms)])
+        try:
+            while not os.path.exists(path):
+                if server.poll() is not None: sys.exit("question service failed to start")
+                time.sleep(0.05)
+            samples, wall = _run_load(path, args)
+            stats = QuestionServiceClient(path).stats()
+        finally:
+            server.terminate()
+            server.wait()
+    total = args.clients * args.threads * args.requests
+    summaries += [summarize(f"service {name}", timings, wall_s=wall) for name, timings in samples.items()]
+    samples, local_wall = _run_load(None, args)
+    summaries += [summarize(f"local {name}", timings, wall_s=local_wall) for name, timings in samples.items()]
+    print_summaries(summaries)
+    print(f"{total} question + submit round trips: service {wall:.2f} s, local {local_wall:.2f} s")
+    for name, batch in stats["batches"].items():
+        print(f"service {name}: {batch['items']} requests in {batch['batches']} batches ({batch['items'] / max(batch['batches'], 1):.1f} per batch)")
+    failed = check_p99(summaries, args.max_p99_ms)
+    if failed:
+        print(f"p99 over {args.max_p99_ms} ms: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import sys
+
+from _common import quiet_streamlit
+
+quiet_streamlit()
+
+import conversion_core as core
+import streamlit_app as app
+
+# Bytes held per session for the question, the step sequence and the feedback, comparing the compact
+# representation (CompactQuestion, byte array, SubmissionRecord) with the previous one (question dict,
+# list of str/float steps, pre-rendered feedback HTML string). Objects owned by module-level tables
+# (unit strings, conversion dicts, step tokens) are shared by all sessions and not counted.
+def _shared_ids():
+    shared = set()
+    for conversion in core.FLAT_CONVERSION_PAIRS:
+        shared.add(id(conversion))
+        shared.update(id(v) for v in conversion.values())
+    shared.update(id(token) for token in core.STEP_TOKENS)
+    shared.add(id(core.FLAT_CONVERSION_PAIRS))
+    return shared
+
+def deep_sizeof(obj, shared_ids, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen or id(obj) in shared_ids or obj is None or isinstance(obj, bool): return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, shared_ids, seen) + deep_sizeof(v, shared_ids, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(deep_sizeof(item, shared_ids, seen) for item in obj)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, slot), shared_ids, seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+def main(sessions=1000):
+    shared = _shared_ids()
+    batch = core.generate_question_batch(sessions, seed=0)
+    before = after = 0
+    for row in range(sessions):
+        question = core.question_from_batch(batch, row)
+        # A typical state after a wrong submission: two steps entered, feedback with the ideal steps
+        op = "÷" if question.operation_per_step_correct == "×" else "×"
+        steps = [op, 10, op, 100]
+        codes = core.new_step_sequence(core.encode_step(step) for step in steps)
+        status, result, is_correct = core.grade_step_codes(question, codes)
+        submission = app.SubmissionRecord(status, core.new_step_sequence(codes), result, is_correct)
+        legacy_state = {"current_question_data": question.as_dict(), "student_sequence": [op, 10.0, op, 100.0],
+                        "feedback_html_content": app.render_feedback_html(question, submission, False)}
+        compact_state = {"current_question_data": question, "student_sequence": codes, "last_submission": submission}
+        before += sum(deep_sizeof(v, shared) for v in legacy_state.values())
+        after += sum(deep_sizeof(v, shared) for v in compact_state.values())
+    print(f"bytes per session, question + sequence + feedback ({sessions} sessions)")
+    print(f"  dict/list/HTML string:                 {before / sessions:8.0f}")
+    print(f"  CompactQuestion/byte array/submission: {after / sessions:8.0f} ({before / after:.1f}x smaller)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+import time
+
+from _common import APP_PATH, check_p99, print_summaries, summarize
+
+# Cold-start benchmark: every sample is a fresh Python process, so nothing is already imported or cached.
+# One process times importing the offline grader (grade_submissions); another imports Streamlit (the
+# server has done this before any request arrives), then executes the app script the way Streamlit does
+# on every rerun (bare mode, no browser): the first execution is what the first request on a new worker
+# pays, the following ones are warm reruns of the same session.
+# --app-path points at another checkout's streamlit_app.py to compare before/after a change.
+_IMPORT_PROBE = "import sys, time; sys.path.insert(0, sys.argv[1]); started = time.perf_counter(); import grade_submissions; print(time.perf_counter() - started)"
+
+def _child(app_path, reruns):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(app_path))) # `streamlit run` does the same
+    from _common import quiet_streamlit
+    quiet_streamlit()
+    import streamlit # noqa: F401
+    timings = {"first rerun": [], "warm rerun": []}
+    for rerun in range(reruns + 1):
+        started = time.perf_counter()
+        runpy.run_path(app_path, run_name="__main__")
+        timings["first rerun" if rerun == 0 else "warm rerun"].append(time.perf_counter() - started)
+    print(json.dumps(timings))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fresh-process startup and first-rerun latency of streamlit_app.")
+    parser.add_argument("--processes", type=int, default=5, help="Fresh processes to sample")
+    parser.add_argument("--reruns", type=int, default=50, help="Warm reruns timed per process")
+    parser.add_argument("--app-path", default=APP_PATH)
+    parser.add_argument("--max-p99-ms", type=float, help="Fail if any benchmark's p99 exceeds this")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child: return _child(args.app_path, args.reruns)
+
+    samples = {}
+    env = {**os.environ, "UNIT_APP_ATTEMPT_LOG": ""} # Don't write an attempt log from the benchmark
+    for _ in range(args.processes):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE, os.path.dirname(os.path.abspath(args.app_path))],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        samples.setdefault("import grade_submissions", []).append(float(output.strip().splitlines()[-1]))
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--app-path", args.app_path, "--reruns", str(args.reruns)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        for name, timings in json.loads(output.strip().splitlines()[-1]).items(): samples.setdefault(name, []).extend(timings)
+    summaries = [summarize(name, timings) for name, timings in samples.items()]
+    print_summaries(summaries)
+    failed = check_p99(summaries, args.max_p99_ms)
+    if failed:
+        print(f"p99 over {args.max_p99_ms} ms: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,753 @@
+import array
+import collections
+import functools
+import math
+import random
+import threading
+import types
+import numpy as np
+from decimal import Decimal
+from fractions import Fraction
+
+# Unit-conversion logic shared by the Streamlit app, the offline grader and the benchmarks: conversion
+# tables, number formatting, question generation and grading. Nothing here imports Streamlit. Derived
+# tables are built once when the module is first imported and then frozen (read-only mappings and
+# arrays), so every session, thread and rerun in the process can share them.
+# --- Constants for Factor Options ---
+STEP_OPERATIONS = ("×", "÷")
+STANDARD_FACTORS_VALUES = [10, 100, 1000] 
+SCI_FACTORS_MAP = { # Value: (Unicode Label for markdown/text, Plain text label for buttons)
+    0.001: ("10⁻³", "10^-3"), 
+    0.01: ("10⁻²", "10^-2"),
+    0.1: ("10⁻¹", "10^-1"),
+    10: ("10¹", "10^1"),
+    100: ("10²", "10^2"),
+    1000: ("10³", "10^3"),
+}
+
+# 1. Conversion Data Store (Multi-step structure with Unicode superscripts for units)
+CONVERSIONS = {
+    "length": [
+        {"from": "m", "to": "km", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "km", "to": "m", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "cm", "to": "m", "base_factor": 100, "power": 1, "operation_per_step": "÷"},
+        {"from": "m", "to": "cm", "base_factor": 100, "power": 1, "operation_per_step": "×"},
+        {"from": "mm", "to": "cm", "base_factor": 10, "power": 1, "operation_per_step": "÷"},
+        {"from": "cm", "to": "mm", "base_factor": 10, "power": 1, "operation_per_step": "×"},
+        {"from": "m", "to": "mm", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "mm", "to": "m", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "km", "to": "cm", "base_factor": 100000, "power": 1, "operation_per_step": "×"},
+        {"from": "cm", "to": "km", "base_factor": 100000, "power": 1, "operation_per_step": "÷"},
+    ],
+    "mass": [
+        {"from": "g", "to": "kg", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "kg", "to": "g", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "mg", "to": "g", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "g", "to": "mg", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "kg", "to": "mg", "base_factor": 1000000, "power": 1, "operation_per_step": "×"},
+        {"from": "mg", "to": "kg", "base_factor": 1000000, "power": 1, "operation_per_step": "÷"},
+    ],
+    "volume_liquid": [
+        {"from": "mL", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "L", "to": "mL", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "L", "to": "kL", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+        {"from": "kL", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "mL", "to": "kL", "base_factor": 1000000, "power": 1, "operation_per_step": "÷"},
+        {"from": "kL", "to": "mL", "base_factor": 1000000, "power": 1, "operation_per_step": "×"},
+    ],
+    "area": [ 
+        {"from": "cm²", "to": "m²", "base_factor": 100, "power": 2, "operation_per_step": "÷"},
+        {"from": "m²", "to": "cm²", "base_factor": 100, "power": 2, "operation_per_step": "×"},
+        {"from": "mm²", "to": "cm²", "base_factor": 10, "power": 2, "operation_per_step": "÷"},
+        {"from": "cm²", "to": "mm²", "base_factor": 10, "power": 2, "operation_per_step": "×"},
+        {"from": "m²", "to": "km²", "base_factor": 1000, "power": 2, "operation_per_step": "÷"},
+        {"from": "km²", "to": "m²", "base_factor": 1000, "power": 2, "operation_per_step": "×"},
+        {"from": "mm²", "to": "m²", "base_factor": 1000, "power": 2, "operation_per_step": "÷"},
+        {"from": "m²", "to": "mm²", "base_factor": 1000, "power": 2, "operation_per_step": "×"},
+    ],
+    "volume_metric_cubed": [ 
+        {"from": "cm³", "to": "m³", "base_factor": 100, "power": 3, "operation_per_step": "÷"},
+        {"from": "m³", "to": "cm³", "base_factor": 100, "power": 3, "operation_per_step": "×"},
+        {"from": "mm³", "to": "cm³", "base_factor": 10, "power": 3, "operation_per_step": "÷"},
+        {"from": "cm³", "to": "mm³", "base_factor": 10, "power": 3, "operation_per_step": "×"},
+        {"from": "m³", "to": "km³", "base_factor": 1000, "power": 3, "operation_per_step": "÷"},
+        {"from": "km³", "to": "m³", "base_factor": 1000, "power": 3, "operation_per_step": "×"},
+        {"from": "mm³", "to": "m³", "base_factor": 1000, "power": 3, "operation_per_step": "÷"},
+        {"from": "m³", "to": "mm³", "base_factor": 1000, "power": 3, "operation_per_step": "×"},
+        {"from": "cm³", "to": "mL", "base_factor": 1, "power": 1, "operation_per_step": "×"},
+        {"from": "mL", "to": "cm³", "base_factor": 1, "power": 1, "operation_per_step": "×"},
+        {"from": "m³", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
+        {"from": "L", "to": "m³", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
+    ]
+}
+
+# --- Exact Power-of-Ten Arithmetic ---
+# Every conversion factor and every factor button is a power of 10, so values are kept as Decimals
+# (an integer coefficient scaled by a power of ten) and a whole op/factor sequence reduces to one
+# integer exponent. Shifting a Decimal by that exponent is exact, which keeps float noise such as
+# 0.1 * 0.01 chains out of generation, grading and the displayed steps.
+def to_exact_decimal(value):
+    return value if isinstance(value, Decimal) else Decimal(repr(float(value)))
+
+def _integer_exponent(value):
+    # n for value == 10 ** n (value a positive int), else None
+    digits = str(value)
+    return len(digits) - 1 if digits[0] == "1" and digits[1:].strip("0") == "" else None
+
+@functools.lru_cache(maxsize=256)
+def power_of_ten_exponent(value):
+    """n such that value == 10 ** n exactly, or None if value is not a power of ten."""
+    if isinstance(value, Fraction):
+        numerator_exp, denominator_exp = _integer_exponent(value.numerator), _integer_exponent(value.denominator)
+        return None if numerator_exp is None or denominator_exp is None or value <= 0 else numerator_exp - denominator_exp
+    try: exact = to_exact_decimal(value)
+    except (ValueError, TypeError, OverflowError): return None
+    if not exact.is_finite() or exact <= 0: return None
+    exact = exact.normalize()
+    return exact.adjusted() if exact.as_tuple().digits == (1,) else None
+
+# --- Precompiled Conversion Graph ---
+# Every category in CONVERSIONS is treated as a graph of units; each listed entry is an edge whose
+# effective factor is base_factor ** power. All reachable unit pairs are resolved once at import with
+# exact rational arithmetic, so lookups during question generation and checking are O(1).
+# Derived pairs wider than the listed ones get starts that keep the start value and the answer within
+# [10^QUESTION_MIN_EXPONENT, 10^QUESTION_MAX_EXPONENT), the range format_number_display shows legibly;
+# those whose factor leaves no room for that (km³ <-> cm³, mm³, mL) are not asked. A derived pair that
+# repeats a conversion listed in another category (mL <-> L through cm³ and m³) is not asked either.
+QUESTION_MIN_EXPONENT, QUESTION_MAX_EXPONENT = -3, 12
+def _effective_ratio(conversion):
+    # Ratio r such that value_in_to = value_in_from * r
+    factor = Fraction(conversion["base_factor"]) ** conversion["power"]
+    return factor if conversion["operation_per_step"] == "×" else 1 / factor
+
+def _integer_root(value, power):
+    # Exact integer p-th root of a positive Fraction, or None if there is none
+    if value.denominator != 1 or power < 1: return None
+    root = round(value.numerator ** (1 / power))
+    for candidate in (root - 1, root, root + 1):
+        if candidate > 0 and candidate ** power == value.numerator: return candidate
+    return None
+
+def _build_conversion_graph(conversions):
+    pairs_by_category = {}
+    listed_anywhere = {(conversion["from"], conversion["to"]) for edges in conversions.values() for conversion in edges}
+    for category_name, edges in conversions.items():
+        adjacency, listed = {}, {}
+        for conversion in edges:
+            ratio = _effective_ratio(conversion)
+            adjacency.setdefault(conversion["from"], []).append((conversion["to"], ratio, conversion["power"]))
+            adjacency.setdefault(conversion["to"], []).append((conversion["from"], 1 / ratio, conversion["power"]))
+            listed[(conversion["from"], conversion["to"])] = conversion
+
+        category_pairs = []
+        for source in adjacency:
+            # BFS from each unit; (ratio, powers seen on the path) per reachable unit
+            reached = {source: (Fraction(1), frozenset())}
+            queue = [source]
+            for unit in queue:
+                unit_ratio, unit_powers = reached[unit]
+                for neighbour, edge_ratio, edge_power in adjacency[unit]:
+                    path_ratio = unit_ratio * edge_ratio
+                    if neighbour in reached:
+                        if reached[neighbour][0] != path_ratio:
+                            raise ValueError(f"Inconsistent conversions in '{category_name}': {source} -> {neighbour}")
+                        continue
+                    reached[neighbour] = (path_ratio, unit_powers | {edge_power})
+                    queue.append(neighbour)
+
+            for target, (ratio, powers) in reached.items():
+                if target == source: continue
+                if (source, target) in listed:
+                    conversion = dict(listed[(source, target)])
+                else:
+                    op_per_step = "×" if ratio >= 1 else "÷"
+                    eff_total_factor = ratio if ratio >= 1 else 1 / ratio
+                    power = next(iter(powers)) if len(powers) == 1 else 1
+                    base_factor = _integer_root(eff_total_factor, power)
+                    if base_factor is None: base_factor, power = eff_total_factor, 1
+                    if isinstance(base_factor, Fraction) and base_factor.denominator == 1: base_factor = base_factor.numerator
+                    conversion = {"from": source, "to": target, "base_factor": base_factor, "power": power, "operation_per_step": op_per_step}
+                conversion["ratio"], conversion["exponent"] = ratio, power_of_ten_exponent(ratio)
+                if (source, target) not in listed and ((source, target) in listed_anywhere or conversion["exponent"] is not None
+                        and abs(conversion["exponent"]) >= QUESTION_MAX_EXPONENT - QUESTION_MIN_EXPONENT): continue
+                category_pairs.append(types.MappingProxyType(conversion))
+        pairs_by_category[category_name] = tuple(category_pairs)
+    return pairs_by_category
+
+# CONVERSION_PAIRS: category -> every askable (from, to) conversion, as read-only views in the dict shape of CONVERSIONS
+CONVERSION_PAIRS = types.MappingProxyType(_build_conversion_graph(CONVERSIONS))
+CATEGORY_NAMES = tuple(CONVERSION_PAIRS.keys())
+
+# --- Helper Function for Unicode Superscripts ---
+_SUPERSCRIPT_TABLE = str.maketrans("0123456789-+", "⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺")
+
+def get_unicode_superscript(exponent_val_str):
+    return exponent_val_str.translate(_SUPERSCRIPT_TABLE)
+
+# --- Helper Function for Formatting Numbers ---
+# format_number_display is called for every value and button on every rerun, so results are cached:
+# factor labels are precomputed once below and everything else goes through a bounded LRU cache.
+FORMAT_CACHE_SIZE = 4096
+
+def format_number_display(num_val_input, sci_notation_enabled=False, for_button_label=False):
+    if isinstance(num_val_input, str) and num_val_input in STEP_OPERATIONS:
+        return num_val_input
+    key = (num_val_input, bool(sci_notation_enabled), bool(for_button_label))
+    try:
+        label = _FACTOR_LABELS.get(key)
+        return label if label is not None else _format_number_display_cached(*key)
+    except TypeError: # Unhashable input
+        return _format_number_display_uncached(*key)
+
+def format_number_array(values, sci_notation_enabled=False, for_button_label=False):
+    """Format a whole array of numbers for batch exports; returns an object array of labels.
+    Standard mode picks integer snapping and decimal places for the whole array in NumPy and leaves
+    one format call per element. Scientific mode formats each distinct value once and broadcasts it."""
+    values = np.asarray(values, dtype=float)
+    if sci_notation_enabled:
+        unique_values, inverse = np.unique(values, return_inverse=True)
+        labels = np.array([format_number_display(v, True, for_button_label) for v in unique_values.tolist()], dtype=object)
+        return labels[inverse.reshape(-1)].reshape(values.shape)
+
+    flat = values.reshape(-1)
+    rounded, abs_vals = np.round(flat), np.abs(flat)
+    with np.errstate(invalid="ignore"): is_integer = np.abs(flat - rounded) <= 1e-9
+    decimals = np.select([abs_vals < 0.00001, abs_vals < 0.001, abs_vals < 1], [7, 5, 4], 2)
+    use_fast_path = np.isfinite(flat) & (flat >= 0) # Negative and non-finite values keep the scalar rules
+    labels = np.empty(flat.shape, dtype=object)
+    for i, (num_val, rounded_val, integer_flag, decimal_places, fast) in enumerate(zip(
+            flat.tolist(), rounded.tolist(), is_integer.tolist(), decimals.tolist(), use_fast_path.tolist())):
+        if not fast: labels[i] = format_number_display(num_val, False, for_button_label)
+        elif integer_flag: labels[i] = f"{int(rounded_val):,}".replace(",", " ")
+        else: labels[i] = f"{num_val:,.{decimal_places}f}".rstrip('0').rstrip('.').replace(",", " ")
+    return labels.reshape(values.shape)
+
+def round_to_display(values, sci_notation_enabled=False):
+    """Values rounded to the digits format_number_display prints for them (three significant figures in
+    scientific mode), so a printed start value is exactly the number its answer is worked out from."""
+    values = np.asarray(values, dtype=float)
+    if sci_notation_enabled: return np.array([float(f"{v:.2e}") for v in values.reshape(-1).tolist()]).reshape(values.shape)
+    decimals = np.select([np.abs(values) < 0.00001, np.abs(values) < 0.001, np.abs(values) < 1], [7, 5, 4], 2)
+    return np.array([round(v, d) for v, d in zip(values.reshape(-1).tolist(), decimals.reshape(-1).tolist())]).reshape(values.shape)
+
+def _format_number_display_uncached(num_val_input, sci_notation_enabled=False, for_button_label=False):
+    if isinstance(num_val_input, str) and num_val_input in STEP_OPERATIONS:
+        return num_val_input
+    try:
+        num_val = float(num_val_input)
+    except (ValueError, TypeError):
+        return str(num_val_input) 
+
+    if math.isnan(num_val) or math.isinf(num_val):
+        return str(num_val)
+
+    integer_tolerance = 1e-9 
+    if math.isclose(num_val, round(num_val), rel_tol=0, abs_tol=integer_tolerance):
+        num_val = float(round(num_val)) 
+
+    if sci_notation_enabled:
+        if num_val == 0: return "0"
+        if not math.isclose(num_val, 0, abs_tol=integer_tolerance) and num_val in SCI_FACTORS_MAP:
+            unicode_label_markdown, unicode_label_button = SCI_FACTORS_MAP[num_val]
+            return unicode_label_button if for_button_label else unicode_label_markdown
+        
+        exponent = math.floor(math.log10(abs(num_val)))
+        mantissa = num_val / (10**exponent)
+
+        if math.isclose(mantissa, round(mantissa), abs_tol=integer_tolerance):
+            mantissa_str = str(int(round(mantissa)))
+        else:
+            if abs(mantissa) >= 100: mantissa_str = f"{mantissa:.0f}"
+            elif abs(mantissa) >= 10: mantissa_str = f"{mantissa:.1f}".rstrip('0').rstrip('.')
+            elif abs(mantissa) >= 1: mantissa_str = f"{mantissa:.2f}".rstrip('0').rstrip('.')
+            else: 
+                mantissa_str = f"{mantissa:.2f}".rstrip('0').rstrip('.')
+                if mantissa_str == "0" and not math.isclose(mantissa, 0):
+                     mantissa_str = f"{mantissa:.3f}".rstrip('0').rstrip('.')
+                if mantissa_str == "0" and not math.isclose(mantissa, 0):
+                     mantissa_str = f"{mantissa:.4f}".rstrip('0').rstrip('.')
+        
+        try: # Check for 1 or -1 mantissa to simplify display
+            mantissa_float_for_check = float(mantissa_str)
+            if math.isclose(mantissa_float_for_check, 1.0, abs_tol=integer_tolerance) and exponent != 0:
+                return f"10{get_unicode_superscript(str(exponent))}"
+            if math.isclose(mantissa_float_for_check, -1.0, abs_tol=integer_tolerance) and exponent != 0:
+                return f"-10{get_unicode_superscript(str(exponent))}"
+        except ValueError: pass
+
+        if exponent == 0: return mantissa_str
+        return f"{mantissa_str} × 10{get_unicode_superscript(str(exponent))}"
+    else: 
+        if num_val == int(num_val):
+            return f"{int(num_val):,}".replace(",", " ") 
+        else:
+            if abs(num_val) < 0.00001 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.7f}"
+            elif abs(num_val) < 0.001 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.5f}"
+            elif abs(num_val) < 1 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.4f}"
+            else: s = f"{num_val:.2f}" 
+            
+            s = s.rstrip('0').rstrip('.')
+            if not s or s == "-": s = "0" 
+            if '.' in s:
+                integer_part_str, decimal_part_str = s.split('.', 1)
+                try: 
+                    integer_part_formatted = f"{int(float(integer_part_str)):,}".replace(",", " ") if integer_part_str and integer_part_str != "-" else "0"
+                    if integer_part_str == "-": integer_part_formatted = "-0" 
+                except ValueError: 
+                    integer_part_formatted = "0" if not (integer_part_str and integer_part_str.startswith('-')) else "-0"
+                return f"{integer_part_formatted}.{decimal_part_str}"
+            else: 
+                try: return f"{int(float(s)):,}".replace(",", " ")
+                except ValueError: return "0"
+
+_format_number_display_cached = functools.lru_cache(maxsize=FORMAT_CACHE_SIZE)(_format_number_display_uncached)
+_FACTOR_LABELS = types.MappingProxyType({
+    (factor_value, sci_on, for_button): _format_number_display_uncached(factor_value, sci_on, for_button)
+    for factor_value in [*STANDARD_FACTORS_VALUES, *SCI_FACTORS_MAP] for sci_on in (False, True) for for_button in (False, True)
+})
+
+# --- Helper to get available step options based on toggle ---
+# The option set only depends on the sci-notation toggle, so both layouts (labels, values and
+# widget keys) are built once at import. Keys are deterministic so Streamlit keeps the same
+# button widgets across reruns and only sends the deltas.
+FACTOR_BUTTONS_PER_ROW = 3
+
+def _build_available_steps(sci_notation_enabled):
+    operations = [("×", "×")] 
+    factors = []
+    if sci_notation_enabled:
+        sorted_sci_factors = sorted(SCI_FACTORS_MAP.items(), key=lambda item: item[0])
+        for actual_value, labels_tuple in sorted_sci_factors:
+            _, plain_text_label_for_button = labels_tuple 
+            factors.append((plain_text_label_for_button, actual_value)) 
+    else:
+        operations.append(("÷", "÷")) 
+        sorted_standard_factors = sorted(STANDARD_FACTORS_VALUES)
+        for actual_value in sorted_standard_factors:
+            display_label_for_button = format_number_display(actual_value, False, for_button_label=True) 
+            factors.append((display_label_for_button, actual_value))
+    return tuple(operations), tuple(factors)
+
+def _option_key(kind, disp_label, actual_val):
+    key_suffix = disp_label.replace("^","p").replace("⁻","m").replace(" ","")
+    return f"avail_{kind}_btn_{str(actual_val)}_{key_suffix}"
+
+def _build_button_layout(sci_notation_enabled):
+    operations, factors = AVAILABLE_STEPS[sci_notation_enabled]
+    factor_buttons = [(disp_label, actual_val, _option_key("factor", disp_label, actual_val)) for disp_label, actual_val in factors]
+    return types.MappingProxyType({
+        "operations": tuple((disp_label, actual_val, _option_key("op", disp_label, actual_val)) for disp_label, actual_val in operations),
+        "factor_rows": tuple(tuple(factor_buttons[i:i + FACTOR_BUTTONS_PER_ROW]) for i in range(0, len(factor_buttons), FACTOR_BUTTONS_PER_ROW)),
+    })
+
+AVAILABLE_STEPS = types.MappingProxyType({sci_on: _build_available_steps(sci_on) for sci_on in (False, True)})
+BUTTON_LAYOUTS = types.MappingProxyType({sci_on: _build_button_layout(sci_on) for sci_on in (False, True)})
+
+def get_current_available_steps(sci_notation_enabled):
+    return AVAILABLE_STEPS[bool(sci_notation_enabled)]
+
+def get_button_layout(sci_notation_enabled):
+    return BUTTON_LAYOUTS[bool(sci_notation_enabled)]
+
+# --- Vectorized Question Generation ---
+# Flat, array-backed view of CONVERSION_PAIRS so whole batches can be sampled in a few NumPy calls
+FLAT_CONVERSION_PAIRS = tuple(conversion for category_name in CATEGORY_NAMES for conversion in CONVERSION_PAIRS[category_name])
+_PAIR_COUNTS = np.array([len(CONVERSION_PAIRS[category_name]) for category_name in CATEGORY_NAMES], dtype=np.int64)
+_PAIR_OFFSETS = np.concatenate(([0], np.cumsum(_PAIR_COUNTS)[:-1]))
+_PAIR_CATEGORY = np.repeat(np.arange(len(CATEGORY_NAMES), dtype=np.int8), _PAIR_COUNTS)
+_PAIR_BASE_FACTOR = np.array([float(c["base_factor"]) for c in FLAT_CONVERSION_PAIRS])
+_PAIR_POWER = np.array([c["power"] for c in FLAT_CONVERSION_PAIRS], dtype=np.int64)
+_PAIR_IS_DIVISION = np.array([c["operation_per_step"] == "÷" for c in FLAT_CONVERSION_PAIRS])
+_PAIR_RATIO = np.array([float(c["ratio"]) for c in FLAT_CONVERSION_PAIRS])
+_PAIR_EXPONENT = np.array([c["exponent"] or 0 for c in FLAT_CONVERSION_PAIRS], dtype=np.int64) # 0 when not a power of ten
+for _table in (_PAIR_COUNTS, _PAIR_OFFSETS, _PAIR_CATEGORY, _PAIR_BASE_FACTOR, _PAIR_POWER, _PAIR_IS_DIVISION, _PAIR_RATIO, _PAIR_EXPONENT):
+    _table.flags.writeable = False
+# The start-value rules below are tuned for the listed conversions, all within 10^±9
+LEGACY_START_MAX_EXPONENT = 9
+_QUESTION_RNG = np.random.default_rng()
+
+def generate_question_batch(count, seed=None, category_weights=None, rng=None, pair_indices=None):
+    """Sample `count` questions at once. Returns a columnar dict of NumPy arrays:
+    category (int8 index into CATEGORY_NAMES), pair_index (int32 index into FLAT_CONVERSION_PAIRS),
+    start_value_raw and correct_answer_raw (float64). Passing a seed makes the batch reproducible;
+    callers on other threads pass their own `rng`. category_weights is an optional
+    {category_name: weight} mapping (missing categories get 0); categories are uniform otherwise.
+    pair_indices fixes the conversion of every row instead of sampling it."""
+    if rng is None: rng = _QUESTION_RNG if seed is None else np.random.default_rng(seed)
+    if pair_indices is not None:
+        pair_index = np.broadcast_to(np.asarray(pair_indices, dtype=np.int64), (count,))
+        category = _PAIR_CATEGORY[pair_index]
+    else:
+        if category_weights is None: category = rng.integers(0, len(CATEGORY_NAMES), size=count)
+        else: category = rng.choice(len(CATEGORY_NAMES), size=count, p=category_probabilities(category_weights))
+        pair_index = _PAIR_OFFSETS[category] + (rng.random(count) * _PAIR_COUNTS[category]).astype(np.int64)
+    base_factor, power, is_division = _PAIR_BASE_FACTOR[pair_index], _PAIR_POWER[pair_index], _PAIR_IS_DIVISION[pair_index]
+    eff_total_factor = base_factor ** power
+
+    # Division questions: start in the "from" unit at a size that gives a readable answer
+    div_val = np.select(
+        [eff_total_factor > 100000, eff_total_factor > 1000],
+        [rng.uniform(0.1, 50, count) * eff_total_factor * rng.choice([0.1, 1, 10], count),
+         rng.uniform(1, 500, count) * eff_total_factor * rng.choice([0.01, 0.1, 1, 10], count) / rng.choice([1, 10, 100], count)],
+        rng.uniform(1, 1000, count) * rng.choice([0.1, 1, 10], count) * eff_total_factor)
+    # Multiplication questions: keep the start small enough that the answer stays displayable
+    max_divisor_power = np.where(power > 0, power, 1)
+    mul_val = np.select(
+        [(power >= 3) & (base_factor >= 1000), (power >= 2) & (base_factor >= 100)],
+        [rng.uniform(0.00001, 0.1, count), rng.uniform(0.01, 50, count)],
+        rng.uniform(0.1, 500, count) / base_factor ** rng.integers(0, max_divisor_power + 1))
+    mul_val = np.where((base_factor > 100) & (power > 1), mul_val / rng.choice([1, 10], count), mul_val)
+
+    start_value_raw = np.clip(np.where(is_division, div_val, mul_val), 1e-9, 1e12)
+    # Wider derived pairs (km² -> mm², L -> km³, ...): a two-significant-figure start in a decade that
+    # keeps both the start and the answer inside the displayable range
+    exponent = _PAIR_EXPONENT[pair_index]
+    wide = np.abs(exponent) > LEGACY_START_MAX_EXPONENT
+    if wide.any():
+        decade = rng.integers(np.maximum(QUESTION_MIN_EXPONENT, QUESTION_MIN_EXPONENT - exponent),
+                              np.minimum(QUESTION_MAX_EXPONENT, QUESTION_MAX_EXPONENT - exponent))
+        tenths = rng.integers(10, 100, count).astype(float) # Mantissa 1.0 to 9.9, exact at any decade below
+        wide_start = np.where(decade >= 1, tenths * 10.0 ** np.maximum(decade - 1, 0), tenths / 10.0 ** np.maximum(1 - decade, 0))
+        start_value_raw = np.where(wide, wide_start, start_value_raw)
+    return {
+        "category": category.astype(np.int8), "pair_index": pair_index.astype(np.int32),
+        "start_value_raw": start_value_raw, "correct_answer_raw": start_value_raw * _PAIR_RATIO[pair_index],
+    }
+
+def category_probabilities(category_weights):
+    weights = np.array([float(category_weights.get(category_name, 0)) for category_name in CATEGORY_NAMES])
+    if weights.min() < 0 or weights.sum() <= 0: raise ValueError(f"Invalid category weights: {category_weights}")
+    return weights / weights.sum()
+
+class CompactQuestion:
+    """A question as an index into FLAT_CONVERSION_PAIRS plus two floats. Units, factor, power and
+    operation are read from the shared pair table rather than copied into every session."""
+    __slots__ = ("pair_index", "start_value_raw", "correct_answer_raw")
+
+    def __init__(self, pair_index, start_value_raw, correct_answer_raw):
+        self.pair_index, self.start_value_raw, self.correct_answer_raw = int(pair_index), float(start_value_raw), float(correct_answer_raw)
+
+    @property
+    def conversion(self): return FLAT_CONVERSION_PAIRS[self.pair_index]
+    @property
+    def category(self): return CATEGORY_NAMES[_PAIR_CATEGORY[self.pair_index]]
+    @property
+    def from_unit(self): return self.conversion["from"]
+    @property
+    def to_unit(self): return self.conversion["to"]
+    @property
+    def base_factor_correct(self): return self.conversion["base_factor"]
+    @property
+    def power_correct(self): return self.conversion["power"]
+    @property
+    def operation_per_step_correct(self): return self.conversion["operation_per_step"]
+    @property
+    def exponent_correct(self): return self.conversion["exponent"]
+
+    def as_dict(self):
+        return {
+            "from_unit": self.from_unit, "to_unit": self.to_unit, "start_value_raw": self.start_value_raw,
+            "base_factor_correct": self.base_factor_correct, "power_correct": self.power_correct,
+            "operation_per_step_correct": self.operation_per_step_correct,
+            "correct_answer_raw": self.correct_answer_raw, "exponent_correct": self.exponent_correct
+        }
+
+def question_from_batch(batch, row):
+    pair_index = int(batch["pair_index"][row])
+    conversion, start_value_raw = FLAT_CONVERSION_PAIRS[pair_index], float(batch["start_value_raw"][row])
+    # Worked out from the start value, which callers may have rounded (see round_to_display)
+    if conversion["exponent"] is None: correct_answer_raw = start_value_raw * float(conversion["ratio"])
+    else: correct_answer_raw = float(to_exact_decimal(start_value_raw).scaleb(conversion["exponent"]))
+    return CompactQuestion(pair_index, start_value_raw, correct_answer_raw)
+
+# --- Compact Step Sequences ---
+# A student's sequence is stored as a signed-byte array of codes into STEP_TOKENS (the operations and
+# every factor button value) instead of a list of mixed str/float objects.
+STEP_TOKENS = (*STEP_OPERATIONS, *sorted(set(STANDARD_FACTORS_VALUES) | set(SCI_FACTORS_MAP)))
+_STEP_TOKEN_CODES = types.MappingProxyType({token: code for code, token in enumerate(STEP_TOKENS)})
+
+def new_step_sequence(codes=()):
+    return array.array("b", codes)
+
+def encode_step(option_actual_value):
+    return _STEP_TOKEN_CODES[option_actual_value]
+
+def decode_sequence(codes):
+    return [STEP_TOKENS[code] for code in codes]
+
+# --- Optimal Step Solver ---
+# For each sci-notation mode, the shortest op/factor sequence that performs every conversion using only
+# that mode's buttons (e.g. km -> cm is × 1 000 × 100 in standard mode, since 100 000 is not a button).
+# Computed once at import by a shortest-path search over powers of ten. Ties go to the sequence that
+# repeats the conversion's own per-step factor (m² -> cm² stays × 100 × 100), then to larger steps first.
+# Every button is a power of ten, so a student sequence is also checked by summing the exponents of its
+# token codes (_STEP_CODE_EXPONENTS) rather than replaying it in floats.
+_STEP_CODE_EXPONENTS = tuple(None if token in STEP_OPERATIONS else power_of_ten_exponent(token) for token in STEP_TOKENS)
+_MULTIPLY_CODE, _DIVIDE_CODE = _STEP_TOKEN_CODES["×"], _STEP_TOKEN_CODES["÷"]
+
+def _mode_step_exponents(sci_notation_enabled):
+    # exponent -> (op, factor) for every button combination available in the mode
+    operations, factors = AVAILABLE_STEPS[sci_notation_enabled]
+    steps = {}
+    for op, _ in operations:
+        for _, factor in factors:
+            exponent = power_of_ten_exponent(factor)
+            if exponent is not None: steps.setdefault(exponent if op == "×" else -exponent, (op, factor))
+    return steps
+
+def _step_distances(step_exponents, limit):
+    # Fewest steps from 0 to every exponent in [-limit, limit] (breadth-first search)
+    distances, frontier = {0: 0}, [0]
+    while frontier:
+        next_frontier = []
+        for exponent in frontier:
+            for step in step_exponents:
+                reached = exponent + step
+                if abs(reached) <= limit and reached not in distances:
+                    distances[reached] = distances[exponent] + 1
+                    next_frontier.append(reached)
+        frontier = next_frontier
+    return distances
+
+def _solve_steps(target, step_exponents, distances, preferred_step=None, preferred_count=None):
+    # Shortest non-empty list of step exponents summing to target, or None if unreachable
+    if target == 0: # No steps would leave nothing to submit; shortest there-and-back instead
+        candidates = [(1 + distances[-step], step) for step in step_exponents if -step in distances]
+        if not candidates: return None
+        _, first_step = min(candidates, key=lambda c: (c[0], -abs(c[1]), -c[1]))
+        return [first_step, *_solve_steps(-first_step, step_exponents, distances)]
+    if target not in distances: return None
+    if preferred_step in step_exponents and preferred_count == distances[target] and preferred_step * preferred_count == target:
+        return [preferred_step] * preferred_count
+    path, remaining = [], target
+    ordered_steps = sorted(step_exponents, key=lambda step: (-abs(step), -step))
+    while remaining:
+        step = next(s for s in ordered_steps if (remaining - s) in distances and distances[remaining - s] == distances[remaining] - 1)
+        path.append(step)
+        remaining -= step
+    return path
+
+def _build_step_solutions(sci_notation_enabled):
+    step_exponents = _mode_step_exponents(sci_notation_enabled)
+    limit = max(abs(c["exponent"] or 0) for c in FLAT_CONVERSION_PAIRS) + max(map(abs, step_exponents))
+    distances = _step_distances(step_exponents, limit)
+    solutions = []
+    for conversion in FLAT_CONVERSION_PAIRS:
+        base_exponent = power_of_ten_exponent(conversion["base_factor"])
+        preferred_step = None if base_exponent is None else (base_exponent if conversion["operation_per_step"] == "×" else -base_exponent)
+        path = None if conversion["exponent"] is None else _solve_steps(conversion["exponent"], step_exponents, distances, preferred_step, conversion["power"])
+        if path is None: raise ValueError(f"No button sequence converts {conversion['from']} to {conversion['to']}")
+        solutions.append(tuple((*step_exponents[step], step) for step in path))
+    return tuple(solutions)
+
+# STEP_SOLUTIONS[sci_on][pair_index] -> ((op, factor, exponent), ...). Every conversion must be doable with
+# each mode's buttons; the module refuses to import otherwise, so the app can rely on a solution.
+STEP_SOLUTIONS = types.MappingProxyType({sci_on: _build_step_solutions(sci_on) for sci_on in (False, True)})
+
+def step_solution(pair_index, sci_notation_enabled):
+    return STEP_SOLUTIONS[bool(sci_notation_enabled)][pair_index]
+
+def grade_step_codes(question, codes):
+    """Grade an encoded button sequence: structure is checked on the codes and correctness is the sum
+    of the factors' exponents compared with the question's. The result is the start value shifted by
+    that exponent, exactly, with no float replay. Statuses are the same as grade_sequence's."""
+    if not codes: return "empty", None, None
+    if len(codes) % 2 != 0: return "incomplete", None, False
+    net_exponent = 0
+    for i in range(0, len(codes), 2):
+        op_code, factor_exponent = codes[i], _STEP_CODE_EXPONENTS[codes[i+1]]
+        if factor_exponent is None: return "invalid_factor", None, False
+        if op_code not in (_MULTIPLY_CODE, _DIVIDE_CODE): return "invalid_op", None, False
+        net_exponent += factor_exponent if op_code == _MULTIPLY_CODE else -factor_exponent
+    return "ok", float(to_exact_decimal(question.start_value_raw).scaleb(net_exponent)), net_exponent == question.exponent_correct
+
+# --- Grading Core (no Streamlit dependency) ---
+ANSWER_REL_TOL, ANSWER_ABS_TOL = 1e-7, 1e-9
+
+def grade_sequence(start_value_raw, correct_answer_raw, student_seq):
+    """Replay an op/factor sequence on the start value in floats and compare it with the correct answer
+    (isclose rule). Returns (status, student_result_raw, is_correct); status is "ok", "empty",
+    "incomplete", "invalid_factor", "div_by_zero" or "invalid_op". This is the grader for exported
+    submissions of arbitrary factors; the app grades its button codes with grade_step_codes."""
+    if not student_seq: return "empty", None, None
+    if len(student_seq) % 2 != 0: return "incomplete", None, False
+    current_calc_val = start_value_raw
+    for i in range(0, len(student_seq), 2):
+        op_str = student_seq[i]
+        try: factor_actual_value = float(student_seq[i+1])
+        except (ValueError, TypeError): return "invalid_factor", None, False
+        if op_str == "÷":
+            if factor_actual_value == 0: return "div_by_zero", None, False
+            current_calc_val /= factor_actual_value
+        elif op_str == "×": current_calc_val *= factor_actual_value
+        else: return "invalid_op", None, False
+    return "ok", current_calc_val, math.isclose(current_calc_val, correct_answer_raw, rel_tol=ANSWER_REL_TOL, abs_tol=ANSWER_ABS_TOL)
+
+def grade_sequences_batch(start_values_raw, correct_answers_raw, student_seqs):
+    """Vectorized grade_sequence over many submissions. Sequences are validated per row, then every
+    valid row's factors are multiplied out in one np.multiply.reduceat call. Returns a columnar dict:
+    status (object array), student_result_raw (float64, NaN when not "ok") and is_correct (bool)."""
+    count = len(student_seqs)
+    status = np.full(count, "ok", dtype=object)
+    multipliers, offsets, ok_rows = [], [], []
+    for row, student_seq in enumerate(student_seqs):
+        if not student_seq: status[row] = "empty"; continue
+        if len(student_seq) % 2 != 0: status[row] = "incomplete"; continue
+        row_multipliers = []
+        for i in range(0, len(student_seq), 2):
+            op_str = student_seq[i]
+            try: factor_actual_value = float(student_seq[i+1])
+            except (ValueError, TypeError): status[row] = "invalid_factor"; break
+            if op_str == "÷":
+                if factor_actual_value == 0: status[row] = "div_by_zero"; break
+                row_multipliers.append(1 / factor_actual_value)
+            elif op_str == "×": row_multipliers.append(factor_actual_value)
+            else: status[row] = "invalid_op"; break
+        else:
+            offsets.append(len(multipliers)); multipliers.extend(row_multipliers); ok_rows.append(row)
+
+    student_result_raw = np.full(count, np.nan)
+    is_correct = np.zeros(count, dtype=bool)
+    if ok_rows:
+        ok_rows = np.asarray(ok_rows)
+        student_result_raw[ok_rows] = np.asarray(start_values_raw, dtype=float)[ok_rows] * np.multiply.reduceat(np.asarray(multipliers), offsets)
+        correct = np.asarray(correct_answers_raw, dtype=float)[ok_rows]
+        # Same symmetric rule as math.isclose, which np.isclose is not
+        diff, scale = np.abs(student_result_raw[ok_rows] - correct), np.maximum(np.abs(student_result_raw[ok_rows]), np.abs(correct))
+        is_correct[ok_rows] = diff <= np.maximum(ANSWER_REL_TOL * scale, ANSWER_ABS_TOL)
+    return {"status": status, "student_result_raw": student_result_raw, "is_correct": is_correct}
+
+# --- Pre-generated Question Pool ---
+# A QuestionPool keeps ready-made CompactQuestions; a daemon thread tops it back up in batches whenever it
+# drops below the low watermark, so sampling and question_from_batch stay off the caller's path.
+# With pair_buckets (adaptive selection, which picks the conversion itself) it keeps a small bucket per
+# conversion instead of the category-weighted queue, and the same thread refills buckets running low.
+QUESTION_POOL_CAPACITY = 2048
+QUESTION_POOL_LOW_WATERMARK = 512
+PAIR_BUCKET_REFILL = 32 # Questions generated at a time for a specific conversion
+PAIR_BUCKET_LOW_WATERMARK = 8
+
+class QuestionPool:
+    def __init__(self, capacity=QUESTION_POOL_CAPACITY, low_watermark=QUESTION_POOL_LOW_WATERMARK, category_weights=None, seed=None, pair_buckets=False):
+        if category_weights is not None: category_probabilities(category_weights) # Validate early
+        self.capacity, self.low_watermark, self._category_weights = capacity, low_watermark, category_weights
+        self._questions, self._by_pair, self._lock = collections.deque(), {}, threading.Lock()
+        self._pair_buckets = pair_buckets
+        self._low_pairs = set(range(len(FLAT_CONVERSION_PAIRS))) if pair_buckets else set() # Buckets waiting for a refill
+        self._rng = np.random.default_rng(seed) # Only touched by the refill thread
+        self._refill_needed, self._closed = threading.Event(), False
+        self._refill_needed.set()
+        self._worker = threading.Thread(target=self._refill_loop, name="question-pool-refill", daemon=True)
+        self._worker.start()
+
+    def __len__(self):
+        return len(self._questions)
+
+    def pop(self, pair_index=None):
+        """Next question; generated on the spot only if the pool has run dry. With pair_index, the next
+        question for that conversion, from a small per-conversion bucket refilled in batches."""
+        if pair_index is not None: return self._pop_pair(pair_index)
+        with self._lock:
+            question = self._questions.popleft() if self._questions else None
+            if len(self._questions) < self.low_watermark and not self._pair_buckets: self._refill_needed.set()
+        if question is None: question = question_from_batch(generate_question_batch(1, category_weights=self._category_weights, rng=np.random.default_rng()), 0)
+        return question
+
+    def _pop_pair(self, pair_index):
+        with self._lock:
+            bucket = self._by_pair.get(pair_index)
+            question = bucket.popleft() if bucket else None
+            if (bucket is None or len(bucket) < PAIR_BUCKET_LOW_WATERMARK) and pair_index not in self._low_pairs:
+                self._low_pairs.add(pair_index)
+                self._refill_needed.set()
+        if question is None: question = question_from_batch(generate_question_batch(1, rng=np.random.default_rng(), pair_indices=pair_index), 0)
+        return question
+
+    def close(self):
+        self._closed = True
+        self._refill_needed.set()
+
+    def _refill_loop(self):
+        while True:
+            self._refill_needed.wait()
+            if self._closed: return
+            self._refill_needed.clear()
+            self._refill_buckets()
+            if not self._pair_buckets: self._refill_queue()
+
+    def _refill_buckets(self):
+        with self._lock: low = sorted(self._low_pairs)
+        if not low: return
+        pair_indices = np.repeat(low, PAIR_BUCKET_REFILL)
+        batch = generate_question_batch(len(pair_indices), rng=self._rng, pair_indices=pair_indices)
+        questions = [question_from_batch(batch, row) for row in range(len(pair_indices))]
+        with self._lock:
+            for start, pair_index in zip(range(0, len(questions), PAIR_BUCKET_REFILL), low):
+                self._by_pair.setdefault(pair_index, collections.deque()).extend(questions[start:start + PAIR_BUCKET_REFILL])
+            self._low_pairs.difference_update(low)
+
+    def _refill_queue(self):
+        with self._lock: missing = self.capacity - len(self._questions)
+        if missing <= 0: return
+        batch = generate_question_batch(missing, category_weights=self._category_weights, rng=self._rng)
+        questions = [question_from_batch(batch, row) for row in range(missing)]
+        with self._lock: self._questions.extend(questions[:self.capacity - len(self._questions)])
+
+# --- Adaptive Question Selection ---
+# Each session keeps a MasteryScheduler: an exponentially decayed error rate per conversion in
+# FLAT_CONVERSION_PAIRS, turned into sampling weights held in a Fenwick tree. A submit updates one
+# conversion in O(log n) and picking the next question is one O(log n) prefix-sum search, with no
+# rescans of history, however large the catalog grows. Weights start out equal to the category-then-
+# conversion distribution (category_weights, uniform by default) and shift toward conversions the
+# student keeps missing; conversions in zero-weight categories are never picked.
+MASTERY_PRIOR_ERROR = 0.5 # Error rate assumed for conversions the student has not tried yet
+MASTERY_DECAY = 0.7 # Weight of the previous error rate in each update
+MASTERY_WEIGHT_FLOOR = 0.1 # Mastered conversions still come up now and then
+
+def pair_shares(category_weights=None):
+    """Probability of each conversion in FLAT_CONVERSION_PAIRS when a category is drawn by
+    category_weights (uniform if None) and then a conversion uniformly within it."""
+    probabilities = np.full(len(CATEGORY_NAMES), 1 / len(CATEGORY_NAMES)) if category_weights is None else category_probabilities(category_weights)
+    return tuple(map(float, probabilities[_PAIR_CATEGORY] / _PAIR_COUNTS[_PAIR_CATEGORY]))
+
+_PAIR_SHARE = pair_shares()
+
+class MasteryScheduler:
+    __slots__ = ("_error", "_tree", "_total", "_share", "_last")
+
+    def __init__(self, category_weights=None):
+        self._share = _PAIR_SHARE if category_weights is None else pair_shares(category_weights)
+        self._last = max(pair_index for pair_index, share in enumerate(self._share) if share > 0)
+        self._error = array.array("d", [MASTERY_PRIOR_ERROR] * len(FLAT_CONVERSION_PAIRS))
+        self._tree = array.array("d", [0.0] * (len(FLAT_CONVERSION_PAIRS) + 1))
+        self._total = 0.0
+        for pair_index in range(len(FLAT_CONVERSION_PAIRS)): self._add(pair_index, self.weight(pair_index))
+
+    def weight(self, pair_index):
+        return self._share[pair_index] * (MASTERY_WEIGHT_FLOOR + self._error[pair_index])
+
+    def error_rate(self, pair_index):
+        return self._error[pair_index]
+
+    def _add(self, pair_index, delta):
+        position, tree = pair_index + 1, self._tree
+        while position < len(tree):
+            tree[position] += delta
+            position += position & -position
+        self._total += delta
+
+    def update(self, pair_index, is_correct):
+        old_weight = self.weight(pair_index)
+        self._error[pair_index] = MASTERY_DECAY * self._error[pair_index] + (1 - MASTERY_DECAY) * (0.0 if is_correct else 1.0)
+        self._add(pair_index, self.weight(pair_index) - old_weight)
+
+    def sample(self, uniform_draw=None):
+        """Pair index drawn in proportion to the current weights; uniform_draw is a number in [0, 1)."""
+        target = (random.random() if uniform_draw is None else uniform_draw) * self._total
+        position, tree, step = 0, self._tree, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            next_position = position + step
+            if next_position < len(tree) and tree[next_position] <= target:
+                position, target = next_position, target - tree[next_position]
+            step >>= 1
+        return min(position, self._last) # Rounding can carry target past the last weighted conversion
@@ -0,0 +1,183 @@
+import argparse
+import csv
+import functools
+import html
+import io
+import itertools
+import re
+import sys
+
+import numpy as np
+
+from conversion_core import (
+    CATEGORY_NAMES, format_number_array, format_number_display, generate_question_batch, question_from_batch, round_to_display, step_solution,
+)
+
+# Printable worksheets with answer keys. Questions are generated and formatted --chunk-size at a time,
+# and every writer is a generator of output chunks, so a 100k-question export holds one chunk of rows
+# (plus, for PDF, one byte offset per page object) in memory at a time. Questions are grouped into
+# sheets; each sheet is followed by its own answer key, so nothing has to be kept until the end.
+#   $ python export_worksheets.py 100000 worksheet.pdf --sci --seed 7
+WORKSHEET_FORMATS = ("pdf", "html", "csv")
+WORKSHEET_MIME_TYPES = {"pdf": "application/pdf", "html": "text/html", "csv": "text/csv"}
+WORKSHEET_FIELDS = ["number", "category", "question", "answer", "steps"]
+WORKSHEET_TITLE = "Unit Conversion Worksheet"
+QUESTIONS_PER_SHEET = 25
+ANSWER_BLANK = "__________"
+
+@functools.lru_cache(maxsize=None)
+def _steps_text(pair_index, sci_notation_enabled):
+    solution = step_solution(pair_index, sci_notation_enabled)
+    if solution is None: return ""
+    return " ".join(f"{op} {format_number_display(factor, sci_notation_enabled, for_button_label=True)}" for op, factor, _ in solution)
+
+def worksheet_rows(count, sci_notation_enabled=False, seed=None, category_weights=None, chunk_size=10000):
+    """Yield `count` numbered questions with their answer key, generated chunk_size at a time."""
+    rng, number = np.random.default_rng(seed), 0
+    while number < count:
+        size = min(chunk_size, count - number)
+        batch = generate_question_batch(size, category_weights=category_weights, rng=rng)
+        batch["start_value_raw"] = round_to_display(batch["start_value_raw"], sci_notation_enabled) # The key must match the printed start
+        questions = [question_from_batch(batch, row) for row in range(size)]
+        starts = format_number_array([q.start_value_raw for q in questions], sci_notation_enabled)
+        answers = format_number_array([q.correct_answer_raw for q in questions], sci_notation_enabled)
+        for question, start, answer in zip(questions, starts.tolist(), answers.tolist()):
+            number += 1
+            yield {"number": number, "category": question.category,
+                   "question": f"Convert {start} {question.from_unit} to {question.to_unit}",
+                   "answer": f"{answer} {question.to_unit}", "steps": _steps_text(question.pair_index, sci_notation_enabled)}
+
+def _sheets(rows, questions_per_sheet):
+    rows = iter(rows)
+    while True:
+        sheet = list(itertools.islice(rows, questions_per_sheet))
+        if not sheet: return
+        yield sheet
+
+# --- CSV ---
+def iter_csv(rows, flush_rows=1000):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=WORKSHEET_FIELDS)
+    writer.writeheader()
+    for chunk in _sheets(rows, flush_rows):
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0); buffer.truncate()
+    if buffer.tell(): yield buffer.getvalue() # No rows: just the header
+
+# --- HTML ---
+_HTML_HEAD = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{title}</title><style>
+body {{ font-family: sans-serif; }} section {{ page-break-after: always; }} li {{ margin: 0.6em 0; }}
+</style></head><body>
+"""
+
+def iter_html(rows, questions_per_sheet=QUESTIONS_PER_SHEET, title=WORKSHEET_TITLE):
+    yield _HTML_HEAD.format(title=html.escape(title))
+    for sheet_number, sheet in enumerate(_sheets(rows, questions_per_sheet), 1):
+        first = sheet[0]["number"]
+        questions = "".join(f"<li>{html.escape(row['question'])} = {ANSWER_BLANK}</li>" for row in sheet)
+        answers = "".join(f"<li>{html.escape(row['answer'])} <small>({html.escape(row['steps'])})</small></li>" for row in sheet)
+        yield (f"<section><h2>{html.escape(title)}: sheet {sheet_number}</h2><ol start=\"{first}\">{questions}</ol></section>\n"
+               f"<section><h2>Answers: sheet {sheet_number}</h2><ol start=\"{first}\">{answers}</ol></section>\n")
+    yield "</body></html>\n"
+
+# --- PDF ---
+# A minimal PDF 1.4 writer (Helvetica text only, no dependencies). Objects are written as pages are
+# produced; the catalog, page tree and font are written last, followed by the cross-reference table.
+PDF_PAGE_SIZE = (595, 842) # A4 in points
+PDF_MARGIN, PDF_FONT_SIZE, PDF_LEADING = 56, 11, 26
+PDF_LINES_PER_PAGE = (PDF_PAGE_SIZE[1] - 2 * PDF_MARGIN) // PDF_LEADING
+_PDF_SUPERSCRIPT_POWER = re.compile("10([⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺]+)")
+_PDF_FROM_SUPERSCRIPT = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺", "0123456789-+")
+
+def _pdf_string(text):
+    # WinAnsi has ×, ÷, ² and ³ (enough for the units) but not the other superscripts: print 10⁻³ as 10^-3
+    text = _PDF_SUPERSCRIPT_POWER.sub(lambda m: "10^" + m.group(1).translate(_PDF_FROM_SUPERSCRIPT), text)
+    return text.encode("cp1252", "replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def _pdf_object(object_id, body):
+    return b"%d 0 obj\n%s\nendobj\n" % (object_id, body)
+
+def _pdf_pages(rows, questions_per_sheet, title):
+    for sheet_number, sheet in enumerate(_sheets(rows, questions_per_sheet), 1):
+        question_lines = [f"{row['number']}. {row['question']} = {ANSWER_BLANK}" for row in sheet]
+        answer_lines = [f"{row['number']}. {row['answer']}   ({row['steps']})" for row in sheet]
+        for heading, lines in ((f"{title}: sheet {sheet_number}", question_lines), (f"Answers: sheet {sheet_number}", answer_lines)):
+            for i in range(0, len(lines), PDF_LINES_PER_PAGE - 2):
+                yield [heading, "", *lines[i:i + PDF_LINES_PER_PAGE - 2]]
+
+def iter_pdf(rows, questions_per_sheet=QUESTIONS_PER_SHEET, title=WORKSHEET_TITLE):
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    yield header
+    # Objects 1-3 (catalog, page tree, font) are written at the end; pages get ids from 4 up
+    offsets, page_ids, position = [None, None, None], [], len(header)
+    for lines in _pdf_pages(rows, questions_per_sheet, title):
+        text = b" T* ".join(b"(%s) Tj" % _pdf_string(line) for line in lines)
+        content = b"BT /F1 %d Tf %d TL %d %d Td %s ET" % (PDF_FONT_SIZE, PDF_LEADING, PDF_MARGIN, PDF_PAGE_SIZE[1] - PDF_MARGIN, text)
+        content_id = len(offsets) + 1
+        for body in (b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content),
+                     b"<< /Type /Page /Parent 2 0 R /Contents %d 0 R >>" % content_id):
+            chunk = _pdf_object(len(offsets) + 1, body)
+            offsets.append(position)
+            position += len(chunk)
+            yield chunk
+        page_ids.append(content_id + 1)
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    for object_id, body in ((1, b"<< /Type /Catalog /Pages 2 0 R >>"),
+                            (2, b"<< /Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> >>"
+                                % (kids, len(page_ids), *PDF_PAGE_SIZE)),
+                            (3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")):
+        chunk = _pdf_object(object_id, body)
+        offsets[object_id - 1] = position
+        position += len(chunk)
+        yield chunk
+    yield b"xref\n0 %d\n0000000000 65535 f \n" % (len(offsets) + 1)
+    for i in range(0, len(offsets), 1000): yield b"".join(b"%010d 00000 n \n" % offset for offset in offsets[i:i + 1000])
+    yield b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(offsets) + 1, position)
+
+def iter_worksheet(file_format, rows, questions_per_sheet=QUESTIONS_PER_SHEET, title=WORKSHEET_TITLE):
+    """Output chunks of the worksheet: bytes for PDF, str for HTML and CSV."""
+    if file_format == "pdf": return iter_pdf(rows, questions_per_sheet, title)
+    if file_format == "html": return iter_html(rows, questions_per_sheet, title)
+    if file_format == "csv": return iter_csv(rows)
+    raise ValueError(f"Unknown worksheet format: {file_format}")
+
+def worksheet_bytes(count, file_format, sci_notation_enabled=False, seed=None, questions_per_sheet=QUESTIONS_PER_SHEET):
+    """A whole worksheet in memory, for small exports such as the app's download button."""
+    chunks = iter_worksheet(file_format, worksheet_rows(count, sci_notation_enabled, seed), questions_per_sheet)
+    return b"".join(chunk if isinstance(chunk, bytes) else chunk.encode("utf-8") for chunk in chunks)
+
+def _detect_format(path, explicit_format):
+    if explicit_format: return explicit_format
+    extension = path.rsplit(".", 1)[-1].lower()
+    return extension if extension in WORKSHEET_FORMATS else "csv"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export printable unit-conversion worksheets with answer keys.")
+    parser.add_argument("count", type=int, help="Number of questions")
+    parser.add_argument("output", help="Output file (.pdf, .html or .csv), or - for stdout")
+    parser.add_argument("--format", choices=WORKSHEET_FORMATS)
+    parser.add_argument("--sci", action="store_true", help="Show numbers and factors in scientific notation")
+    parser.add_argument("--seed", type=int, help="Make the question set reproducible")
+    parser.add_argument("--categories", nargs="+", metavar="CATEGORY", help="Only ask questions from these categories")
+    parser.add_argument("--questions-per-sheet", type=int, default=QUESTIONS_PER_SHEET)
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Questions generated and formatted per batch")
+    args = parser.parse_args(argv)
+    if args.count < 0 or args.questions_per_sheet < 1 or args.chunk_size < 1: parser.error("count must be >= 0, sheet and chunk sizes >= 1")
+
+    file_format = _detect_format(args.output, args.format)
+    category_weights = None if args.categories is None else dict.fromkeys(args.categories, 1)
+    unknown = set(args.categories or ()) - set(CATEGORY_NAMES)
+    if unknown: parser.error(f"unknown categories {sorted(unknown)}; choose from {', '.join(CATEGORY_NAMES)}")
+    rows = worksheet_rows(args.count, args.sci, args.seed, category_weights, args.chunk_size)
+    binary = file_format == "pdf"
+    if args.output == "-": out_file = sys.stdout.buffer if binary else sys.stdout
+    else: out_file = open(args.output, "wb") if binary else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        for chunk in iter_worksheet(file_format, rows, args.questions_per_sheet): out_file.write(chunk)
+    finally:
+        if args.output != "-": out_file.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import csv
+import itertools
+import json
+import math
+import sys
+
+from conversion_core import grade_sequences_batch
+
+# Offline grader for exported attempts. Each submission row carries the question's start value,
+# its correct answer and the student's op/factor sequence:
+#   JSONL: {"id": "a1", "start_value_raw": 2.5, "correct_answer_raw": 2500, "sequence": ["×", 1000]}
+#   CSV:   id,start_value_raw,correct_answer_raw,sequence   (sequence as space-separated tokens: "× 1000")
+# Rows are read, graded and written one chunk at a time, so memory stays bounded by --chunk-size.
+# A row that can't be graded (unreadable line, missing or non-numeric value, bad sequence) gets status
+# "invalid_row" and the reason in "error"; the rest of the file is graded as usual.
+RESULT_FIELDS = ["id", "status", "student_result_raw", "is_correct", "error"]
+
+def read_submissions(in_file, file_format):
+    """Submission dicts; an unreadable JSONL line is yielded as its ValueError, reported by grade_stream."""
+    if file_format == "jsonl":
+        for line_number, line in enumerate(in_file, 1):
+            if not line.strip(): continue
+            try: row = json.loads(line)
+            except ValueError as exc: yield ValueError(f"line {line_number}: invalid JSON ({exc})"); continue
+            yield row if isinstance(row, dict) else ValueError(f"line {line_number}: not a JSON object")
+    else:
+        yield from csv.DictReader(in_file)
+
+def _parse_row(row):
+    """(start_value_raw, correct_answer_raw, sequence) of one submission; ValueError says what is wrong."""
+    if isinstance(row, ValueError): raise row
+    values = []
+    for field in ("start_value_raw", "correct_answer_raw"):
+        if row.get(field) in (None, ""): raise ValueError(f"missing {field}")
+        try: value = float(row[field])
+        except (TypeError, ValueError): raise ValueError(f"{field} is not a number: {row[field]!r}") from None
+        if not math.isfinite(value): raise ValueError(f"{field} is not finite: {row[field]!r}")
+        values.append(value)
+    sequence = row.get("sequence") or [] # A short CSV row has None here
+    if isinstance(sequence, str): sequence = sequence.split() # CSV, or "× 1000" in JSONL
+    elif not isinstance(sequence, list): raise ValueError(f"sequence must be a list or space-separated tokens, not {type(sequence).__name__}")
+    return values[0], values[1], sequence
+
+def grade_stream(submissions, chunk_size=50000):
+    submissions = iter(submissions)
+    while True:
+        chunk = list(itertools.islice(submissions, chunk_size))
+        if not chunk: return
+        parsed, errors = [], []
+        for row in chunk:
+            try: parsed.append(_parse_row(row)); errors.append(None)
+            except ValueError as exc: parsed.append((0.0, 0.0, [])); errors.append(str(exc)) # Placeholder, graded as "empty"
+        start_values, correct_answers, sequences = zip(*parsed)
+        results = grade_sequences_batch(start_values, correct_answers, sequences)
+        for row, error, status, student_result_raw, is_correct in zip(chunk, errors, results["status"], results["student_result_raw"], results["is_correct"]):
+            row_id = row.get("id") if isinstance(row, dict) else None
+            if error is not None:
+                yield {"id": row_id, "status": "invalid_row", "student_result_raw": None, "is_correct": False, "error": error}
+                continue
+            yield {"id": row_id, "status": status,
+                   "student_result_raw": None if math.isnan(student_result_raw) else float(student_result_raw),
+                   "is_correct": bool(is_correct), "error": None}
+
+def write_results(results, out_file, file_format):
+    if file_format == "jsonl":
+        for result in results: out_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+    else:
+        writer = csv.DictWriter(out_file, fieldnames=RESULT_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+def _detect_format(path, explicit_format):
+    if explicit_format: return explicit_format
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grade exported unit-conversion attempts in bulk.")
+    parser.add_argument("input", help="Submissions file (.jsonl or .csv), or - for stdin")
+    parser.add_argument("output", help="Results file (.jsonl or .csv), or - for stdout")
+    parser.add_argument("--input-format", choices=["jsonl", "csv"])
+    parser.add_argument("--output-format", choices=["jsonl", "csv"])
+    parser.add_argument("--chunk-size", type=int, default=50000, help="Rows graded per vectorized batch")
+    args = parser.parse_args(argv)
+
+    in_format, out_format = _detect_format(args.input, args.input_format), _detect_format(args.output, args.output_format)
+    in_file = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    out_file = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    try:
+        write_results(grade_stream(read_submissions(in_file, in_format), args.chunk_size), out_file, out_format)
+    finally:
+        if in_file is not sys.stdin: in_file.close()
+        if out_file is not sys.stdout: out_file.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from conversion_core import (
+    CATEGORY_NAMES, FLAT_CONVERSION_PAIRS, STEP_TOKENS, CompactQuestion, category_probabilities, generate_question_batch,
+    grade_step_codes, new_step_sequence, question_from_batch,
+)
+
+# Question generation and grading as a machine-wide service, so several Streamlit server processes
+# share one set of conversion tables and one pool of worker processes instead of each doing the work
+# in its own script runs. The server is an asyncio loop on a Unix socket speaking newline-delimited JSON:
+#   {"op": "generate", "count": 1, "pair_index": 7}                -> {"result": [[7, 2.5, 2500.0]]}
+#   {"op": "grade", "question": [7, 2.5, 2500.0], "codes": [0, 5]} -> {"result": ["ok", 2500.0, true]}
+#   {"op": "stats"}                                                -> {"result": {"requests": ..., "batches": ...}}
+# Requests arriving within --batch-window-ms of each other (from any connection) are handed to the
+# process pool together, so one worker round trip and one generate_question_batch call serve many
+# students. QuestionServiceClient is the blocking client the app uses; LocalQuestionService runs the
+# same code in-process and stands in for the service in tests and single-process runs.
+#   $ python question_service.py /tmp/unit_app.sock --workers 4
+#   $ UNIT_APP_QUESTION_SERVICE=/tmp/unit_app.sock streamlit run streamlit_app.py
+DEFAULT_BATCH_WINDOW_MS = 2.0
+DEFAULT_MAX_BATCH = 256
+MAX_GENERATE_COUNT = 10000
+
+class QuestionServiceError(Exception):
+    pass
+
+# --- Batch Work (runs in the pool's worker processes) ---
+_WORKER_RNG = None
+
+def _init_worker():
+    global _WORKER_RNG
+    _WORKER_RNG = np.random.default_rng() # Forked workers would otherwise share the parent's random state
+
+def _question_tuple(question):
+    return (question.pair_index, question.start_value_raw, question.correct_answer_raw)
+
+def generate_questions(specs, rng=None):
+    """[(count, category_weights, pair_index)] -> a list of (pair_index, start, correct) tuples per spec.
+    All fixed-conversion specs share one generate_question_batch call, as does each distinct category mix."""
+    rng = rng if rng is not None else _WORKER_RNG if _WORKER_RNG is not None else np.random.default_rng()
+    groups = {} # batch kwargs key -> [(spec index, count, pair_index)]
+    for i, (count, category_weights, pair_index) in enumerate(specs):
+        key = "fixed" if pair_index is not None else None if category_weights is None else tuple(sorted(category_weights.items()))
+        groups.setdefault(key, []).append((i, count, pair_index))
+    results = [None] * len(specs)
+    for key, members in groups.items():
+        total = sum(count for _, count, _ in members)
+        if key == "fixed":
+            pair_indices = np.repeat([pair_index for _, _, pair_index in members], [count for _, count, _ in members])
+            batch = generate_question_batch(total, rng=rng, pair_indices=pair_indices)
+        else:
+            batch = generate_question_batch(total, rng=rng, category_weights=None if key is None else dict(key))
+        row = 0
+        for i, count, _ in members:
+            results[i] = [_question_tuple(question_from_batch(batch, r)) for r in range(row, row + count)]
+            row += count
+    return results
+
+def grade_questions(items):
+    """[(question tuple, step codes)] -> [(status, student_result_raw, is_correct)] via grade_step_codes."""
+    return [grade_step_codes(CompactQuestion(*question), new_step_sequence(codes)) for question, codes in items]
+
+# --- Server ---
+class _Batcher:
+    """Collects items for up to `window` seconds (or max_batch items), then runs them as one call of
+    batch_fn in the executor and resolves each caller's future with its own result."""
+
+    def __init__(self, executor, batch_fn, window, max_batch):
+        self.executor, self.batch_fn, self.window, self.max_batch = executor, batch_fn, window, max_batch
+        self.batches = self.items = 0
+        self._pending, self._timer, self._running = [], None, set()
+
+    def submit(self, item):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch: self._flush()
+        elif self._timer is None: self._timer = loop.call_later(self.window, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None: self._timer.cancel(); self._timer = None
+        pending, self._pending = self._pending, []
+        if not pending: return
+        self.batches, self.items = self.batches + 1, self.items + len(pending)
+        task = asyncio.ensure_future(self._run(pending))
+        self._running.add(task) # Keep a reference until it finishes
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, pending):
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(self.executor, self.batch_fn, [item for item, _ in pending])
+        except Exception as exc:
+            for _, future in pending:
+                if not future.done(): future.set_exception(exc)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done(): future.set_result(result)
+
+class QuestionService:
+    def __init__(self, path, workers=None, batch_window_ms=DEFAULT_BATCH_WINDOW_MS, max_batch=DEFAULT_MAX_BATCH):
+        self.path, self.workers = path, workers or os.cpu_count() or 1
+        self.batch_window, self.max_batch = batch_window_ms / 1000, max_batch
+        self.requests = {"generate": 0, "grade": 0, "stats": 0, "error": 0}
+
+    async def serve(self, ready=None):
+        """Serve until cancelled. `ready`, if given, is a threading.Event set once the socket accepts connections."""
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker) as executor:
+            self._generate = _Batcher(executor, generate_questions, self.batch_window, self.max_batch)
+            self._grade = _Batcher(executor, grade_questions, self.batch_window, self.max_batch)
+            if os.path.exists(self.path): os.unlink(self.path) # Stale socket from an earlier run
+            server = await asyncio.start_unix_server(self._handle_connection, path=self.path)
+            if ready is not None: ready.set()
+            try:
+                async with server: await server.serve_forever()
+            finally:
+                if os.path.exists(self.path): os.unlink(self.path)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try: response = {"result": await self._dispatch(json.loads(line))}
+                except Exception as exc: # Bad request or failed batch: answer with the error, keep the connection
+                    self.requests["error"] += 1
+                    response = {"error": f"{type(exc).__name__}: {exc}"}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request):
+        op = request.get("op")
+        if op not in self.requests or op == "error": raise QuestionServiceError(f"unknown op {op!r}")
+        self.requests[op] += 1
+        if op == "generate":
+            count, category_weights, pair_index = int(request.get("count", 1)), request.get("category_weights"), request.get("pair_index")
+            if not 1 <= count <= MAX_GENERATE_COUNT: raise ValueError(f"count must be between 1 and {MAX_GENERATE_COUNT}")
+            if category_weights is not None: category_probabilities(category_weights) # Reject here, not inside a shared batch
+            if pair_index is not None and not 0 <= int(pair_index) < len(FLAT_CONVERSION_PAIRS): raise ValueError(f"no conversion {pair_index}")
+            return await self._generate.submit((count, category_weights, None if pair_index is None else int(pair_index)))
+        if op == "grade":
+            pair_index, start_value_raw, correct_answer_raw = request["question"]
+            codes = [int(code) for code in request["codes"]]
+            if not 0 <= int(pair_index) < len(FLAT_CONVERSION_PAIRS): raise ValueError(f"no conversion {pair_index}")
+            if any(not 0 <= code < len(STEP_TOKENS) for code in codes): raise ValueError("unknown step code")
+            return await self._grade.submit(((int(pair_index), float(start_value_raw), float(correct_answer_raw)), codes))
+        return {"requests": dict(self.requests), "workers": self.workers, "categories": list(CATEGORY_NAMES),
+                "batches": {name: {"batches": b.batches, "items": b.items} for name, b in (("generate", self._generate), ("grade", self._grade))}}
+
+# --- Clients ---
+class QuestionServiceClient:
+    """Blocking client, safe to share between threads: each call borrows an idle connection (or opens
+    one), so concurrent sessions in one Streamlit process send requests in parallel and get batched."""
+
+    def __init__(self, path, timeout=5.0):
+        self.path, self.timeout = path, timeout
+        self._idle, self._lock = [], threading.Lock()
+
+    def _request(self, payload):
+        with self._lock: connection = self._idle.pop() if self._idle else None
+        try:
+            if connection is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                connection = (sock, sock.makefile("rb"))
+            connection[0].sendall(json.dumps(payload).encode() + b"\n")
+            line = connection[1].readline()
+            if not line: raise ConnectionError("question service closed the connection")
+        except OSError as exc:
+            if connection is not None: connection[1].close(); connection[0].close()
+            raise QuestionServiceError(f"question service at {self.path} unavailable: {exc}") from exc
+        with self._lock: self._idle.append(connection)
+        response = json.loads(line)
+        if "error" in response: raise QuestionServiceError(response["error"])
+        return response["result"]
+
+    def generate(self, count=1, category_weights=None, pair_index=None):
+        return [CompactQuestion(*question) for question in self._request({"op": "generate", "count": count, "category_weights": category_weights, "pair_index": pair_index})]
+
+    def grade(self, question, codes):
+        return tuple(self._request({"op": "grade", "question": _question_tuple(question), "codes": list(codes)}))
+
+    def stats(self):
+        return self._request({"op": "stats"})
+
+    def close(self):
+        with self._lock: idle, self._idle = self._idle, []
+        for sock, file in idle: file.close(); sock.close()
+
+class LocalQuestionService:
+    """In-process stand-in for QuestionServiceClient: same methods and results, no server or pool."""
+
+    def __init__(self, seed=None):
+        self._rng, self._lock = np.random.default_rng(seed), threading.Lock()
+
+    def generate(self, count=1, category_weights=None, pair_index=None):
+        with self._lock: questions = generate_questions([(count, category_weights, pair_index)], self._rng)[0]
+        return [CompactQuestion(*question) for question in questions]
+
+    def grade(self, question, codes):
+        return grade_questions([(_question_tuple(question), list(codes))])[0]
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+async def _serve_until_signalled(service):
+    # SIGTERM/SIGINT cancel serve(), so the socket file is removed on the way out
+    task, loop = asyncio.current_task(), asyncio.get_running_loop()
+    for signal_number in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(signal_number, task.cancel)
+    try: await service.serve()
+    except asyncio.CancelledError: pass
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Shared question generation and grading service on a Unix socket.")
+    parser.add_argument("path", help="Unix socket path, e.g. /tmp/unit_app.sock")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--batch-window-ms", type=float, default=DEFAULT_BATCH_WINDOW_MS, help="How long to collect requests into one batch")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH, help="Send a batch as soon as it has this many requests")
+    args = parser.parse_args(argv)
+    asyncio.run(_serve_until_signalled(QuestionService(args.path, args.workers, args.batch_window_ms, args.max_batch)))
+
+if __name__ == "__main__":
+    main()
@@ -1,227 +1,223 @@
 import streamlit as st
+import bisect
+import functools
+import os
 import random
-import math
-
-# --- Constants for Factor Options ---
-STANDARD_FACTORS_VALUES = [10, 100, 1000] 
-SCI_FACTORS_MAP = { # Value: (Unicode Label for markdown/text, Plain text label for buttons)
-    0.001: ("10⁻³", "10^-3"), 
-    0.01: ("10⁻²", "10^-2"),
-    0.1: ("10⁻¹", "10^-1"),
-    10: ("10¹", "10^1"),
-    100: ("10²", "10^2"),
-    1000: ("10³", "10^3"),
-}
-
-# 1. Conversion Data Store (Multi-step structure with Unicode superscripts for units)
-CONVERSIONS = {
-    "length": [
-        {"from": "m", "to": "km", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "km", "to": "m", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "cm", "to": "m", "base_factor": 100, "power": 1, "operation_per_step": "÷"},
-        {"from": "m", "to": "cm", "base_factor": 100, "power": 1, "operation_per_step": "×"},
-        {"from": "mm", "to": "cm", "base_factor": 10, "power": 1, "operation_per_step": "÷"},
-        {"from": "cm", "to": "mm", "base_factor": 10, "power": 1, "operation_per_step": "×"},
-        {"from": "m", "to": "mm", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "mm", "to": "m", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "km", "to": "cm", "base_factor": 100000, "power": 1, "operation_per_step": "×"},
-        {"from": "cm", "to": "km", "base_factor": 100000, "power": 1, "operation_per_step": "÷"},
-    ],
-    "mass": [
-        {"from": "g", "to": "kg", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "kg", "to": "g", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "mg", "to": "g", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "g", "to": "mg", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "kg", "to": "mg", "base_factor": 1000000, "power": 1, "operation_per_step": "×"},
-        {"from": "mg", "to": "kg", "base_factor": 1000000, "power": 1, "operation_per_step": "÷"},
-    ],
-    "volume_liquid": [
-        {"from": "mL", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "L", "to": "mL", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "L", "to": "kL", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-        {"from": "kL", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "mL", "to": "kL", "base_factor": 1000000, "power": 1, "operation_per_step": "÷"},
-        {"from": "kL", "to": "mL", "base_factor": 1000000, "power": 1, "operation_per_step": "×"},
-    ],
-    "area": [ 
-        {"from": "cm²", "to": "m²", "base_factor": 100, "power": 2, "operation_per_step": "÷"},
-        {"from": "m²", "to": "cm²", "base_factor": 100, "power": 2, "operation_per_step": "×"},
-        {"from": "mm²", "to": "cm²", "base_factor": 10, "power": 2, "operation_per_step": "÷"},
-        {"from": "cm²", "to": "mm²", "base_factor": 10, "power": 2, "operation_per_step": "×"},
-        {"from": "m²", "to": "km²", "base_factor": 1000, "power": 2, "operation_per_step": "÷"},
-        {"from": "km²", "to": "m²", "base_factor": 1000, "power": 2, "operation_per_step": "×"},
-        {"from": "mm²", "to": "m²", "base_factor": 1000, "power": 2, "operation_per_step": "÷"},
-        {"from": "m²", "to": "mm²", "base_factor": 1000, "power": 2, "operation_per_step": "×"},
-    ],
-    "volume_metric_cubed": [ 
-        {"from": "cm³", "to": "m³", "base_factor": 100, "power": 3, "operation_per_step": "÷"},
-        {"from": "m³", "to": "cm³", "base_factor": 100, "power": 3, "operation_per_step": "×"},
-        {"from": "mm³", "to": "cm³", "base_factor": 10, "power": 3, "operation_per_step": "÷"},
-        {"from": "cm³", "to": "mm³", "base_factor": 10, "power": 3, "operation_per_step": "×"},
-        {"from": "m³", "to": "km³", "base_factor": 1000, "power": 3, "operation_per_step": "÷"},
-        {"from": "km³", "to": "m³", "base_factor": 1000, "power": 3, "operation_per_step": "×"},
-        {"from": "mm³", "to": "m³", "base_factor": 1000, "power": 3, "operation_per_step": "÷"},
-        {"from": "m³", "to": "mm³", "base_factor": 1000, "power": 3, "operation_per_step": "×"},
-        {"from": "cm³", "to": "mL", "base_factor": 1, "power": 1, "operation_per_step": "×"},
-        {"from": "mL", "to": "cm³", "base_factor": 1, "power": 1, "operation_per_step": "×"},
-        {"from": "m³", "to": "L", "base_factor": 1000, "power": 1, "operation_per_step": "×"},
-        {"from": "L", "to": "m³", "base_factor": 1000, "power": 1, "operation_per_step": "÷"},
-    ]
-}
-
-# --- Helper Function for Unicode Superscripts ---
-def get_unicode_superscript(exponent_val_str):
-    superscript_map = {"0": "⁰", "1": "¹", "2": "²", "3": "³", "4": "⁴", 
-                       "5": "⁵", "6": "⁶", "7": "⁷", "8": "⁸", "9": "⁹", 
-                       "-": "⁻", "+": "⁺"}
-    return "".join(superscript_map.get(char, char) for char in exponent_val_str)
-
-# --- Helper Function for Formatting Numbers ---
-def format_number_display(num_val_input, sci_notation_enabled=False, for_button_label=False):
-    if isinstance(num_val_input, str) and num_val_input in ["×", "÷"]:
-        return num_val_input
-    try:
-        num_val = float(num_val_input)
-    except (ValueError, TypeError):
-        return str(num_val_input) 
-
-    if math.isnan(num_val) or math.isinf(num_val):
-        return str(num_val)
-
-    integer_tolerance = 1e-9 
-    if math.isclose(num_val, round(num_val), rel_tol=0, abs_tol=integer_tolerance):
-        num_val = float(round(num_val)) 
-
-    if sci_notation_enabled:
-        if num_val == 0: return "0"
-        if not math.isclose(num_val, 0, abs_tol=integer_tolerance) and num_val in SCI_FACTORS_MAP:
-            unicode_label_markdown, unicode_label_button = SCI_FACTORS_MAP[num_val]
-            return unicode_label_button if for_button_label else unicode_label_markdown
-        
-        exponent = math.floor(math.log10(abs(num_val)))
-        mantissa = num_val / (10**exponent)
-
-        if math.isclose(mantissa, round(mantissa), abs_tol=integer_tolerance):
-            mantissa_str = str(int(round(mantissa)))
-        else:
-            if abs(mantissa) >= 100: mantissa_str = f"{mantissa:.0f}"
-            elif abs(mantissa) >= 10: mantissa_str = f"{mantissa:.1f}".rstrip('0').rstrip('.')
-            elif abs(mantissa) >= 1: mantissa_str = f"{mantissa:.2f}".rstrip('0').rstrip('.')
-            else: 
-                mantissa_str = f"{mantissa:.2f}".rstrip('0').rstrip('.')
-                if mantissa_str == "0" and not math.isclose(mantissa, 0):
-                     mantissa_str = f"{mantissa:.3f}".rstrip('0').rstrip('.')
-                if mantissa_str == "0" and not math.isclose(mantissa, 0):
-                     mantissa_str = f"{mantissa:.4f}".rstrip('0').rstrip('.')
-        
-        try: # Check for 1 or -1 mantissa to simplify display
-            mantissa_float_for_check = float(mantissa_str)
-            if math.isclose(mantissa_float_for_check, 1.0, abs_tol=integer_tolerance) and exponent != 0:
-                return f"10{get_unicode_superscript(str(exponent))}"
-            if math.isclose(mantissa_float_for_check, -1.0, abs_tol=integer_tolerance) and exponent != 0:
-                return f"-10{get_unicode_superscript(str(exponent))}"
-        except ValueError: pass
-
-        if exponent == 0: return mantissa_str
-        return f"{mantissa_str} × 10{get_unicode_superscript(str(exponent))}"
-    else: 
-        if num_val == int(num_val):
-            return f"{int(num_val):,}".replace(",", " ") 
-        else:
-            if abs(num_val) < 0.00001 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.7f}"
-            elif abs(num_val) < 0.001 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.5f}"
-            elif abs(num_val) < 1 and not math.isclose(num_val,0,abs_tol=integer_tolerance): s = f"{num_val:.4f}"
-            else: s = f"{num_val:.2f}" 
-            
-            s = s.rstrip('0').rstrip('.')
-            if not s or s == "-": s = "0" 
-            if '.' in s:
-                integer_part_str, decimal_part_str = s.split('.', 1)
-                try: 
-                    integer_part_formatted = f"{int(float(integer_part_str)):,}".replace(",", " ") if integer_part_str and integer_part_str != "-" else "0"
-                    if integer_part_str == "-": integer_part_formatted = "-0" 
-                except ValueError: 
-                    integer_part_formatted = "0" if not (integer_part_str and integer_part_str.startswith('-')) else "-0"
-                return f"{integer_part_formatted}.{decimal_part_str}"
-            else: 
-                try: return f"{int(float(s)):,}".replace(",", " ")
-                except ValueError: return "0"
+import threading
+import time
+import uuid
+
+# Everything that doesn't touch Streamlit (conversion tables, formatting, generation, grading) lives in
+# conversion_core. Streamlit re-executes this script on every rerun, but imported modules stay in
+# sys.modules, so the core's tables and caches are built once per process instead of once per rerun.
+from conversion_core import (
+    FACTOR_BUTTONS_PER_ROW, STEP_OPERATIONS, MasteryScheduler, QuestionPool, decode_sequence, encode_step,
+    format_number_display, get_button_layout, grade_step_codes, new_step_sequence, step_solution, to_exact_decimal,
+)
 
 # --- Streamlit Session State Initialization ---
 def init_session_state():
     keys_to_init = {
-        'current_question_data': {}, 'feedback_html_content': "", 'game_initialized': False,
-        'student_sequence': [], 'sci_notation_enabled': False,
-        'student_calculated_display_value': None, 'is_student_answer_correct': None
+        'current_question_data': None, 'last_submission': None, 'game_initialized': False,
+        'student_sequence': new_step_sequence(), 'sci_notation_enabled': False,
+        'student_calculated_display_value': None, 'is_student_answer_correct': None,
+        'session_id': uuid.uuid4().hex, 'question_started_at': None, 'mastery': None, 'worksheet_request': None
     }
     for key, default_value in keys_to_init.items():
         if key not in st.session_state:
             st.session_state[key] = default_value
 
-# --- Helper to get available step options based on toggle ---
-def get_current_available_steps(sci_notation_enabled):
-    operations = [("×", "×")] 
-    factors = []
-    if sci_notation_enabled:
-        sorted_sci_factors = sorted(SCI_FACTORS_MAP.items(), key=lambda item: item[0])
-        for actual_value, labels_tuple in sorted_sci_factors:
-            _, plain_text_label_for_button = labels_tuple 
-            factors.append((plain_text_label_for_button, actual_value)) 
-    else:
-        operations.append(("÷", "÷")) 
-        sorted_standard_factors = sorted(STANDARD_FACTORS_VALUES)
-        for actual_value in sorted_standard_factors:
-            display_label_for_button = format_number_display(actual_value, False, for_button_label=True) 
-            factors.append((display_label_for_button, actual_value))
-    return operations, factors
+# --- Pre-generated Question Pool ---
+# One pool per server process, shared by all sessions through st.cache_resource; see QuestionPool in conversion_core.
+QUESTION_CATEGORY_WEIGHTS = None # e.g. {"length": 2, "area": 1, ...}; None means uniform
+
+@st.cache_resource
+def get_question_pool():
+    return QuestionPool(category_weights=QUESTION_CATEGORY_WEIGHTS, pair_buckets=ADAPTIVE_SELECTION)
+
+# --- Shared Question Service ---
+# With UNIT_APP_QUESTION_SERVICE set to the socket of a running question_service.py, questions come from
+# and submissions are graded by that machine-wide service, so every Streamlit process on the machine
+# shares its worker pool and batches. If the service can't be reached, the call falls back to the
+# in-process pool and grader above rather than failing the student's click.
+QUESTION_SERVICE_ENV_VAR = "UNIT_APP_QUESTION_SERVICE"
+
+@st.cache_resource
+def get_question_service():
+    path = os.environ.get(QUESTION_SERVICE_ENV_VAR)
+    if not path: return None
+    from question_service import QuestionServiceClient # Only needed (with asyncio) when the service is used
+    return QuestionServiceClient(path)
+
+def next_question(pair_index=None):
+    service = get_question_service()
+    if service is not None:
+        from question_service import QuestionServiceError
+        try: return service.generate(category_weights=QUESTION_CATEGORY_WEIGHTS, pair_index=pair_index)[0]
+        except QuestionServiceError: pass
+    return get_question_pool().pop(pair_index)
+
+def grade_submission(question, codes):
+    service = get_question_service()
+    if service is not None:
+        from question_service import QuestionServiceError
+        try: return service.grade(question, codes)
+        except QuestionServiceError: pass
+    return grade_step_codes(question, codes)
+
+# --- Attempt History ---
+# Every graded submission is appended to a SQLite attempt log (see attempt_log.py) through a buffered
+# background writer, so submitting never waits on disk. UNIT_APP_ATTEMPT_LOG sets the database path;
+# set it to an empty string to turn logging off.
+ATTEMPT_LOG_ENV_VAR = "UNIT_APP_ATTEMPT_LOG"
+DEFAULT_ATTEMPT_LOG_PATH = "attempt_log.sqlite3"
+
+@st.cache_resource
+def get_attempt_log():
+    path = os.environ.get(ATTEMPT_LOG_ENV_VAR, DEFAULT_ATTEMPT_LOG_PATH)
+    if not path: return None
+    from attempt_log import AttemptLog # Only needed (with sqlite3) when logging is on
+    return AttemptLog(path)
+
+def record_attempt(question, submission):
+    attempt_log = get_attempt_log()
+    if attempt_log is None: return
+    started_at = st.session_state.get("question_started_at")
+    attempt_log.record(
+        st.session_state.session_id, question.category, question.from_unit, question.to_unit, question.start_value_raw,
+        " ".join(map(str, decode_sequence(submission.sequence))), submission.status, submission.is_correct,
+        None if started_at is None else (time.monotonic() - started_at) * 1e3)
+
+# --- Adaptive Question Selection ---
+# The scheduler itself (MasteryScheduler) lives in conversion_core; QUESTION_CATEGORY_WEIGHTS are its base rates.
+ADAPTIVE_SELECTION = True
+
+# --- Optional Instrumentation ---
+# Off by default. Enabled for every session with UNIT_APP_PROFILE=1, or per session with ?profile=1.
+# When on, each rerun's phases and each callback are timed into process-wide histograms shown in a
+# debug panel at the bottom of the page. When off, the only cost is one session_state lookup.
+# Only UNIT_APP_PROFILE=1 offers "Reset metrics": a ?profile=1 visitor can read the histograms but not
+# clear them for everyone else.
+PROFILE_ENV_VAR = "UNIT_APP_PROFILE"
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+WIDGET_COUNT_BUCKETS = (5, 10, 15, 20, 30, 50, 100)
+
+class MetricHistogram:
+    __slots__ = ("bounds", "bucket_counts", "count", "total", "max")
+
+    def __init__(self, bounds):
+        self.bounds, self.bucket_counts = bounds, [0] * (len(bounds) + 1)
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def observe(self, value):
+        self.bucket_counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1; self.total += value; self.max = max(self.max, value)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation (max for the overflow bucket)
+        target, seen = q * self.count, 0
+        for bound, bucket_count in zip(self.bounds, self.bucket_counts):
+            seen += bucket_count
+            if seen >= target: return bound
+        return self.max
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock, self._histograms = threading.Lock(), {}
+
+    def observe(self, name, value, bounds=LATENCY_BUCKETS_MS):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None: histogram = self._histograms[name] = MetricHistogram(bounds)
+            histogram.observe(value)
+
+    def snapshot(self):
+        with self._lock:
+            return [{"metric": name, "count": h.count, "mean": h.total / h.count, "p50": h.quantile(0.5),
+                     "p99": h.quantile(0.99), "max": h.max,
+                     "histogram": " ".join(f"≤{b}:{c}" for b, c in zip(h.bounds, h.bucket_counts) if c) + (f" >{h.bounds[-1]}:{h.bucket_counts[-1]}" if h.bucket_counts[-1] else "")}
+                    for name, h in sorted(self._histograms.items())]
+
+    def reset(self):
+        with self._lock: self._histograms.clear()
+
+@st.cache_resource
+def get_metrics_registry():
+    return MetricsRegistry()
+
+def profiling_enabled():
+    return bool(st.session_state.get("profiling_enabled"))
+
+class PhaseTimer:
+    """Times consecutive phases of one (fragment) rerun; lap(name) closes the phase that just ran."""
+    __slots__ = ("scope", "_registry", "_started", "_lap_started", "_widgets")
+
+    def __init__(self, scope):
+        self.scope, self._registry, self._widgets = scope, get_metrics_registry(), 0
+        self._started = self._lap_started = time.perf_counter()
+
+    def lap(self, phase_name):
+        now = time.perf_counter()
+        self._registry.observe(f"{self.scope}/{phase_name} ms", (now - self._lap_started) * 1e3)
+        self._lap_started = now
+
+    def count_widgets(self, count):
+        self._widgets += count
+
+    def finish(self):
+        self._registry.observe(f"{self.scope}/total ms", (time.perf_counter() - self._started) * 1e3)
+        self._registry.observe(f"{self.scope}/widgets", self._widgets, WIDGET_COUNT_BUCKETS)
+
+class _DisabledPhaseTimer:
+    __slots__ = ()
+    def lap(self, phase_name): pass
+    def count_widgets(self, count): pass
+    def finish(self): pass
+
+_DISABLED_PHASE_TIMER = _DisabledPhaseTimer()
+
+def start_phase_timer(scope):
+    return PhaseTimer(scope) if profiling_enabled() else _DISABLED_PHASE_TIMER
+
+def profiled(metric_name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled(): return func(*args, **kwargs)
+            started = time.perf_counter()
+            try: return func(*args, **kwargs)
+            finally: get_metrics_registry().observe(f"{metric_name} ms", (time.perf_counter() - started) * 1e3)
+        return wrapper
+    return decorator
+
+def render_profiling_panel():
+    with st.expander("⏱️ Profiling (all sessions in this process)"):
+        st.dataframe(get_metrics_registry().snapshot(), hide_index=True, use_container_width=True,
+                     column_config={c: st.column_config.NumberColumn(format="%.3f") for c in ("mean", "p50", "p99", "max")})
+        if os.environ.get(PROFILE_ENV_VAR) == "1" and st.button("Reset metrics", key="reset_profiling_metrics_btn"):
+            get_metrics_registry().reset()
 
 # --- Core Application Logic Functions ---
+@profiled("callback/generate_question")
 def generate_question():
-    st.session_state.feedback_html_content = ""
-    st.session_state.student_sequence = [] 
+    st.session_state.last_submission = None
+    st.session_state.student_sequence = new_step_sequence()
     st.session_state.student_calculated_display_value = None 
     st.session_state.is_student_answer_correct = None    
     
-    category_name = random.choice(list(CONVERSIONS.keys()))
-    conversion = random.choice(CONVERSIONS[category_name])
-    base_factor, power, op_per_step = conversion["base_factor"], conversion["power"], conversion["operation_per_step"]
-
-    if op_per_step == "÷": 
-        eff_total_factor = base_factor ** power
-        if eff_total_factor > 100000: base_val = random.uniform(0.1, 50) * eff_total_factor * random.choice([0.1, 1, 10])
-        elif eff_total_factor > 1000: base_val = random.uniform(1, 500) * eff_total_factor * random.choice([0.01,0.1,1,10])/random.choice([1,10,100])
-        else: base_val = random.uniform(1, 1000) * random.choice([0.1,1,10]) * eff_total_factor
-    else: 
-        if power >=3 and base_factor >=1000: base_val = random.uniform(0.00001, 0.1) 
-        elif power >=2 and base_factor >=100: base_val = random.uniform(0.01, 50)
-        else: base_val = random.uniform(0.1, 500) / (base_factor ** random.randint(0, power if power > 0 else 1))
-        if base_factor > 100 and power > 1 : base_val /= random.choice([1,10]) 
-
-    start_value_raw = base_val 
-    if abs(start_value_raw) < 1e-12 and base_val != 0: start_value_raw = 1e-9 if base_val > 0 else -1e-9
-    min_val, max_val = 1e-9, 1e12 
-    start_value_raw = max(min(start_value_raw, max_val), min_val) if start_value_raw > 0 else start_value_raw
-    start_value_raw = min(max(start_value_raw, -max_val), -min_val) if start_value_raw < 0 else start_value_raw
-
-    current_val = start_value_raw
-    for _ in range(power):
-        if op_per_step == "÷":
-            if base_factor == 0: current_val = float('inf'); break
-            current_val /= base_factor
-        else: current_val *= base_factor
-    correct_answer_raw = current_val
-    
-    st.session_state.current_question_data = {
-        "from_unit": conversion['from'], "to_unit": conversion['to'], "start_value_raw": start_value_raw, 
-        "base_factor_correct": base_factor, "power_correct": power, "operation_per_step_correct": op_per_step,
-        "correct_answer_raw": correct_answer_raw 
-    }
+    if ADAPTIVE_SELECTION:
+        if st.session_state.get("mastery") is None: st.session_state.mastery = MasteryScheduler(QUESTION_CATEGORY_WEIGHTS)
+        st.session_state.current_question_data = next_question(st.session_state.mastery.sample())
+    else:
+        st.session_state.current_question_data = next_question()
+    st.session_state.question_started_at = time.monotonic()
     st.session_state.game_initialized = True
 
+@profiled("callback/handle_available_option_click")
 def handle_available_option_click(option_actual_value): 
     st.session_state.student_calculated_display_value = None 
     st.session_state.is_student_answer_correct = None
-    is_op_clicked = isinstance(option_actual_value, str) and option_actual_value in ["×", "÷"]
+    is_op_clicked = isinstance(option_actual_value, str) and option_actual_value in STEP_OPERATIONS
     expecting_operator = len(st.session_state.student_sequence) % 2 == 0
     
     valid_append = False
@@ -234,127 +230,114 @@ def handle_available_option_click(option_actual_value):
     else: 
         if not is_op_clicked: valid_append = True
         else: st.toast("Invalid. Expected a numerical factor.", icon="🚫")
-    if valid_append: st.session_state.student_sequence.append(option_actual_value)
+    if valid_append: st.session_state.student_sequence.append(encode_step(option_actual_value))
 
+@profiled("callback/remove_from_sequence_callback")
 def remove_from_sequence_callback(index_in_sequence): 
     st.session_state.student_calculated_display_value = None 
     st.session_state.is_student_answer_correct = None
     if 0 <= index_in_sequence < len(st.session_state.student_sequence):
         st.session_state.student_sequence.pop(index_in_sequence)
 
+class SubmissionRecord:
+    """What a press of "=" produced; the feedback HTML is rendered from it on demand, not stored."""
+    __slots__ = ("status", "sequence", "student_result_raw", "is_correct", "error_message")
+
+    def __init__(self, status, sequence, student_result_raw=None, is_correct=False, error_message=None):
+        self.status, self.sequence, self.student_result_raw = status, sequence, student_result_raw
+        self.is_correct, self.error_message = is_correct, error_message
+
+STATUS_DISPLAY_VALUES = {"invalid_factor": "Factor Error!", "div_by_zero": "Div by 0!", "invalid_op": "Op Error!", "app_error": "App Error!"}
+
+def result_display_value(question, submission, sci_on):
+    if submission.status != "ok": return STATUS_DISPLAY_VALUES[submission.status]
+    return format_number_display(question.correct_answer_raw if submission.is_correct else submission.student_result_raw, sci_on)
+
+def render_feedback_html(question, submission, sci_on):
+    if submission.status == "app_error": return f"<p style='color:red;'>Unexpected error: {submission.error_message}</p>"
+    if submission.status == "invalid_factor": return "<p style='color:red;'>Error: Invalid factor in sequence.</p>"
+    if submission.status == "div_by_zero": return "<p style='color:red;'>Error: Div by zero.</p>"
+    student_seq = decode_sequence(submission.sequence)
+    if submission.status == "invalid_op":
+        op_str = next(op for op in student_seq[::2] if op not in STEP_OPERATIONS)
+        return f"<p style='color:red;'>Error: Invalid op '{op_str}'.</p>"
+
+    current_feedback_html, is_correct = "", submission.is_correct
+    correct_answer_raw = question.correct_answer_raw
+    submitted_display_sequence_for_feedback = [format_number_display(question.start_value_raw, sci_on)]
+    for i in range(0, len(student_seq), 2):
+        submitted_display_sequence_for_feedback.extend([student_seq[i], format_number_display(float(student_seq[i+1]), sci_on, for_button_label=True)])
+    student_calculated_display_value = result_display_value(question, submission, sci_on)
+
+    current_feedback_html += f"<p>You submitted: {' '.join(submitted_display_sequence_for_feedback)}</p>"
+    current_feedback_html += f"<p>Calculating... = {student_calculated_display_value}</p>"
+    result_unit, correct_answer_display = question.to_unit, format_number_display(correct_answer_raw, sci_on)
+
+    solution = step_solution(question.pair_index, sci_on)
+    if is_correct:
+        current_feedback_html += f"<p style='color:green; font-weight:bold;'>Result: {student_calculated_display_value} {result_unit}. Correct! 🎉</p>"
+        if len(student_seq) // 2 > len(solution):
+            shortest = " ".join(f"{op} {format_number_display(factor, sci_on, for_button_label=True)}" for op, factor, _ in solution)
+            current_feedback_html += f"<p>Tip: this can be done in {len(solution)} step{'s' if len(solution) > 1 else ''}: {shortest}</p>"
+    else:
+        current_feedback_html += f"<p style='color:red; font-weight:bold;'>Result: {student_calculated_display_value} {result_unit}. Not quite. 🤔</p>"
+        current_feedback_html += "<hr><p><strong>Correct steps (ideal):</strong></p>" 
+        current_step_val = to_exact_decimal(question.start_value_raw)
+        current_feedback_html += f"<p>1. Start: {format_number_display(question.start_value_raw, sci_on)} {question.from_unit}</p>"
+        for i_step, (op, factor, exponent) in enumerate(solution):
+            factor_display = format_number_display(factor, sci_on, for_button_label=True)
+            current_feedback_html += f"<p>{i_step+2}. Ideal Step {i_step+1}: ...{'divide by' if op == '÷' else 'multiply by'} {factor_display}.</p>"
+            lhs_disp = format_number_display(current_step_val, sci_on)
+            current_step_val = current_step_val.scaleb(exponent)
+            current_feedback_html += f"<p>   Calc: {lhs_disp} {op} {factor_display} = {format_number_display(current_step_val, sci_on)}</p>"
+        current_feedback_html += f"<p>{len(solution)+2}. Ideal Final: <strong>{correct_answer_display} {question.to_unit}</strong></p>"
+    return current_feedback_html
+
+@profiled("callback/on_submit_button_clicked")
 def on_submit_button_clicked():
-    current_feedback_html = "" 
     cqd = st.session_state.current_question_data
-    student_seq = st.session_state.student_sequence
     sci_on = st.session_state.sci_notation_enabled
-    
-    if not student_seq: 
-        st.toast("Please build your calculation sequence first.", icon="🤔")
-        st.session_state.student_calculated_display_value = "___" 
-        st.session_state.is_student_answer_correct = None; return
-    if len(student_seq) % 2 != 0 : 
-        st.toast("Sequence incomplete. Expected a factor after the last operation.", icon="🤔")
-        st.session_state.student_calculated_display_value = "Incomplete"
-        st.session_state.is_student_answer_correct = False; return
-
-    current_calc_val = cqd["start_value_raw"]
-    submitted_display_sequence_for_feedback = [format_number_display(cqd["start_value_raw"], sci_on)]
 
     try:
-        for i in range(0, len(student_seq), 2):
-            op_str = student_seq[i]
-            if i + 1 >= len(student_seq): 
-                current_feedback_html = "<p style='color:red; font-weight:bold;'>Seq. Error!</p>"
-                st.session_state.student_calculated_display_value = "Seq. Error!"
-                st.session_state.is_student_answer_correct = False; break 
-            factor_actual_value = float(student_seq[i+1]) 
-            factor_display_label_in_seq = format_number_display(factor_actual_value, sci_on, for_button_label=True)
-            submitted_display_sequence_for_feedback.extend([op_str, factor_display_label_in_seq])
-
-            if op_str == "÷":
-                if factor_actual_value == 0: 
-                    current_feedback_html = "<p style='color:red;'>Error: Div by zero.</p>"
-                    st.session_state.student_calculated_display_value = "Div by 0!"
-                    st.session_state.is_student_answer_correct = False; break
-                current_calc_val /= factor_actual_value
-            elif op_str == "×": current_calc_val *= factor_actual_value
-            else: 
-                current_feedback_html = f"<p style='color:red;'>Error: Invalid op '{op_str}'.</p>"
-                st.session_state.student_calculated_display_value = "Op Error!"
-                st.session_state.is_student_answer_correct = False; break
-        else: 
-            student_final_result_raw = current_calc_val
-            correct_answer_raw = cqd["correct_answer_raw"]
-            is_correct = math.isclose(student_final_result_raw, correct_answer_raw, rel_tol=1e-7, abs_tol=1e-9)
-            st.session_state.is_student_answer_correct = is_correct
-
-            if is_correct: st.session_state.student_calculated_display_value = format_number_display(correct_answer_raw, sci_on)
-            else: st.session_state.student_calculated_display_value = format_number_display(student_final_result_raw, sci_on)
-            
-            current_feedback_html += f"<p>You submitted: {' '.join(submitted_display_sequence_for_feedback)}</p>"
-            current_feedback_html += f"<p>Calculating... = {st.session_state.student_calculated_display_value}</p>"
-            result_unit, correct_answer_display = cqd['to_unit'], format_number_display(correct_answer_raw, sci_on)
-
-            if is_correct:
-                current_feedback_html += f"<p style='color:green; font-weight:bold;'>Result: {st.session_state.student_calculated_display_value} {result_unit}. Correct! 🎉</p>"
-            else:
-                current_feedback_html += f"<p style='color:red; font-weight:bold;'>Result: {st.session_state.student_calculated_display_value} {result_unit}. Not quite. 🤔</p>"
-                current_feedback_html += "<hr><p><strong>Correct steps (ideal):</strong></p>" 
-                correct_op, correct_bf_val, power, sv_raw = cqd['operation_per_step_correct'], cqd['base_factor_correct'], cqd['power_correct'], cqd['start_value_raw']
-                from_u, to_u = cqd['from_unit'], cqd['to_unit']
-                current_step_val_raw = sv_raw
-                current_feedback_html += f"<p>1. Start: {format_number_display(sv_raw, sci_on)} {from_u}</p>"
-                correct_bf_display = format_number_display(correct_bf_val, sci_on, for_button_label=True) 
-                for i_step in range(power):
-                    current_feedback_html += f"<p>{i_step+2}. Ideal Step {i_step+1}: ...{'divide by' if correct_op == '÷' else 'multiply by'} {correct_bf_display}.</p>"
-                    lhs_disp = format_number_display(current_step_val_raw, sci_on)
-                    if correct_op == "÷": current_step_val_raw /= correct_bf_val
-                    else: current_step_val_raw *= correct_bf_val
-                    rhs_disp = format_number_display(current_step_val_raw, sci_on)
-                    current_feedback_html += f"<p>   Calc: {lhs_disp} {correct_op} {correct_bf_display} = {rhs_disp}</p>"
-                current_feedback_html += f"<p>{i_step+3}. Ideal Final: <strong>{correct_answer_display} {to_u}</strong></p>"
-        st.session_state.feedback_html_content = current_feedback_html
-    except ValueError:
-        st.session_state.student_calculated_display_value = "Factor Error!"
-        st.session_state.is_student_answer_correct = False
-        st.session_state.feedback_html_content = "<p style='color:red;'>Error: Invalid factor in sequence.</p>"
+        status, student_final_result_raw, is_correct = grade_submission(cqd, st.session_state.student_sequence)
+        if status == "empty":
+            st.toast("Please build your calculation sequence first.", icon="🤔")
+            st.session_state.student_calculated_display_value = "___" 
+            st.session_state.is_student_answer_correct = None; return
+        if status == "incomplete":
+            st.toast("Sequence incomplete. Expected a factor after the last operation.", icon="🤔")
+            st.session_state.student_calculated_display_value = "Incomplete"
+            st.session_state.is_student_answer_correct = False; return
+        submission = SubmissionRecord(status, new_step_sequence(st.session_state.student_sequence), student_final_result_raw, is_correct)
+        st.session_state.is_student_answer_correct = is_correct
+        st.session_state.student_calculated_display_value = result_display_value(cqd, submission, sci_on)
+        st.session_state.last_submission = submission
+        record_attempt(cqd, submission)
+        if st.session_state.get("mastery") is not None: st.session_state.mastery.update(cqd.pair_index, status == "ok" and is_correct)
     except Exception as e:
         st.session_state.student_calculated_display_value = "App Error!"
         st.session_state.is_student_answer_correct = False
-        st.session_state.feedback_html_content = f"<p style='color:red;'>Unexpected error: {e}</p>"
+        st.session_state.last_submission = SubmissionRecord("app_error", new_step_sequence(), error_message=str(e))
 
 def on_new_question_clicked(): 
     generate_question()
     st.rerun() 
 
-# --- Main App Layout and Execution ---
-def main():
-    st.set_page_config(page_title="Unit Converter Practice", layout="wide") 
-    st.title("👩‍🔬 Interactive Unit Converter 📐")
-    init_session_state() 
-    st.session_state.sci_notation_enabled = st.toggle(
-        "Enable Scientific Notation (e.g., 10², 1.23 × 10⁵)", 
-        value=st.session_state.get('sci_notation_enabled', False), key="sci_notation_toggle_widget",
-        help="Toggles number display and available factor options. Division (÷) is hidden in scientific mode; use multiplication by negative powers of 10 (e.g., × 10⁻¹)."
-    )
-    sci_on = st.session_state.sci_notation_enabled 
-    st.markdown("Build the conversion step-by-step. Click an item in your calculation to remove it.")
-
-    if not st.session_state.game_initialized: generate_question() 
-    cqd = st.session_state.get('current_question_data', {})
-    
-    if cqd and "start_value_raw" in cqd:
-        start_val_disp_q = format_number_display(cqd["start_value_raw"], sci_on)
-        st.markdown(f"### Convert: {start_val_disp_q} {cqd['from_unit']} to {cqd['to_unit']}", unsafe_allow_html=True)
-    else: 
-        st.markdown("### Loading question...")
-        if st.button("Start / Reload Question", key="manual_start_btn_main_top_v8"): 
-            generate_question(); st.rerun()
+# --- Interactive Calculation Area ---
+# Everything a click can change (sequence builder, result line, option grid and feedback) lives in one
+# fragment, so adding/removing a step or pressing "=" reruns only this region, not the title, toggle and
+# question header. The option grid has to share the fragment with the sequence it appends to, since a
+# fragment rerun cannot redraw another fragment. "New Question" still triggers a full-app rerun.
+@st.fragment
+def calculation_area():
+    timer = start_phase_timer("calculation_area")
+    sci_on = st.session_state.sci_notation_enabled
+    cqd = st.session_state.get('current_question_data')
 
     st.markdown("---") 
     st.markdown("**Your current calculation:**")
     
-    if cqd and "start_value_raw" in cqd: 
+    if cqd is not None: 
         # --- Display student's calculation sequence (Part 1) ---
         num_sequence_items = len(st.session_state.student_sequence)
         # Define relative widths: start_value wider, buttons narrower
@@ -363,8 +346,8 @@ def main():
         if col_widths_spec_seq: 
             seq_cols_line1 = st.columns(col_widths_spec_seq)
             with seq_cols_line1[0]:
-                st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{format_number_display(cqd['start_value_raw'], sci_on)}</div>", unsafe_allow_html=True)
-            for i, item_val in enumerate(st.session_state.student_sequence):
+                st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{format_number_display(cqd.start_value_raw, sci_on)}</div>", unsafe_allow_html=True)
+            for i, item_val in enumerate(decode_sequence(st.session_state.student_sequence)):
                 if i + 1 < len(seq_cols_line1): 
                     with seq_cols_line1[i+1]: 
                         st.button(format_number_display(item_val, sci_on, for_button_label=True), 
@@ -372,7 +355,7 @@ def main():
                                   on_click=remove_from_sequence_callback, args=(i,), 
                                   help="Remove this step", use_container_width=False) 
         else: 
-             st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{format_number_display(cqd['start_value_raw'], sci_on)}</div>", unsafe_allow_html=True)
+             st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{format_number_display(cqd.start_value_raw, sci_on)}</div>", unsafe_allow_html=True)
 
         # --- Display Submit ("=") button, result, and target unit (Part 2, new line) ---
         submit_result_cols = st.columns([0.6, 2, 1.5]) 
@@ -386,41 +369,107 @@ def main():
             elif st.session_state.is_student_answer_correct is False: res_color = "red"
             st.markdown(f"<div style='padding-top:0.5rem; font-weight:bold; font-size:1.1em; color:{res_color}; white-space:nowrap; text-align:left;'>{res_disp}</div>", unsafe_allow_html=True)
         with submit_result_cols[2]: 
-            st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{cqd['to_unit']}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div style='padding-top:0.5rem; font-size:1.1em; white-space:nowrap; text-align:left;'>{cqd.to_unit}</div>", unsafe_allow_html=True)
+        timer.count_widgets(len(st.session_state.student_sequence) + 1)
     else: 
         st.caption("Waiting for question data to display calculation area.")
+    timer.lap("sequence_builder")
 
     st.markdown("---")
     st.write("**Available Operations & Factors:**")
     
-    available_ops_buttons, available_factors_buttons = get_current_available_steps(sci_on)
+    button_layout = get_button_layout(sci_on)
     op_col, factor_col = st.columns([1, 3.5]) 
 
     with op_col:
         st.markdown("**Operations**")
-        for disp_label, actual_val in available_ops_buttons:
-            key_suffix = disp_label.replace("^","p").replace("⁻","m").replace(" ","")
-            op_key = f"avail_op_btn_{str(actual_val)}_{key_suffix}_{random.random()}"
+        for disp_label, actual_val, op_key in button_layout["operations"]:
             st.button(disp_label, key=op_key, on_click=handle_available_option_click, args=(actual_val,), use_container_width=True, help=f"Add {disp_label}")
             
     with factor_col:
         st.markdown("**Factors**")
-        num_factor_cols = 3 
-        factor_rows = [available_factors_buttons[i:i + num_factor_cols] for i in range(0, len(available_factors_buttons), num_factor_cols)]
-        for r_idx, row_tuples in enumerate(factor_rows):
-            cols = st.columns(num_factor_cols)
-            for c_idx, (disp_label, actual_val) in enumerate(row_tuples):
-                key_suffix = disp_label.replace("^","p").replace("⁻","m").replace(" ","")
-                factor_key = f"avail_factor_btn_{str(actual_val)}_{key_suffix}_{r_idx}_{c_idx}_{random.random()}"
+        for row_buttons in button_layout["factor_rows"]:
+            cols = st.columns(FACTOR_BUTTONS_PER_ROW)
+            for c_idx, (disp_label, actual_val, factor_key) in enumerate(row_buttons):
                 cols[c_idx].button(disp_label, key=factor_key, on_click=handle_available_option_click, args=(actual_val,), use_container_width=True, help=f"Add {disp_label}")
+    timer.count_widgets(len(button_layout["operations"]) + sum(len(row) for row in button_layout["factor_rows"]))
+    timer.lap("option_grid")
     
     st.markdown("---")
     if st.button("New Question", key="new_q_btn_bottom_v8", use_container_width=True): 
         on_new_question_clicked()
-    if st.session_state.feedback_html_content:
+    if st.session_state.last_submission is not None and cqd is not None:
         st.markdown("---")
         st.markdown("### Feedback & Calculation Steps:")
-        st.markdown(st.session_state.feedback_html_content, unsafe_allow_html=True)
+        st.markdown(render_feedback_html(cqd, st.session_state.last_submission, sci_on), unsafe_allow_html=True)
+    timer.count_widgets(1)
+    timer.lap("feedback")
+    timer.finish()
+
+# --- Worksheet Export ---
+# Printable worksheets (see export_worksheets.py) straight from the app. The file is only built after
+# "Prepare worksheet", inside this fragment so the rest of the page doesn't rerun, and is cached by its
+# parameters so later reruns reuse it and sessions don't each hold a copy. In-app exports are capped;
+# larger sets go through the export_worksheets.py CLI, which streams to disk.
+WORKSHEET_UI_MAX_QUESTIONS = 2000
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_worksheet(count, file_format, sci_notation_enabled, seed):
+    from export_worksheets import worksheet_bytes
+    return worksheet_bytes(count, file_format, sci_notation_enabled, seed)
+
+@st.fragment
+def worksheet_export_panel():
+    from export_worksheets import WORKSHEET_FORMATS, WORKSHEET_MIME_TYPES
+    with st.expander("🖨️ Printable worksheet"):
+        count_col, format_col, prepare_col = st.columns([2, 2, 1], vertical_alignment="bottom")
+        count = count_col.number_input("Questions", min_value=1, max_value=WORKSHEET_UI_MAX_QUESTIONS, value=50, step=10, key="worksheet_count_input")
+        file_format = format_col.selectbox("Format", WORKSHEET_FORMATS, key="worksheet_format_select")
+        if prepare_col.button("Prepare worksheet", key="worksheet_prepare_btn"):
+            st.session_state.worksheet_request = (int(count), file_format, st.session_state.sci_notation_enabled, random.getrandbits(32))
+        request = st.session_state.worksheet_request
+        if request is not None:
+            count, file_format, sci_on, seed = request
+            with st.spinner("Building worksheet..."): data = build_worksheet(count, file_format, sci_on, seed)
+            st.download_button(f"Download {count} questions with answers ({file_format.upper()})", data, file_name=f"worksheet.{file_format}",
+                               mime=WORKSHEET_MIME_TYPES[file_format], key="worksheet_download_btn", on_click="ignore")
+
+# --- Main App Layout and Execution ---
+def main():
+    st.set_page_config(page_title="Unit Converter Practice", layout="wide") 
+    st.title("👩‍🔬 Interactive Unit Converter 📐")
+    init_session_state() 
+    st.session_state.profiling_enabled = os.environ.get(PROFILE_ENV_VAR) == "1" or st.query_params.get("profile") == "1"
+    timer = start_phase_timer("rerun")
+    st.session_state.sci_notation_enabled = st.toggle(
+        "Enable Scientific Notation (e.g., 10², 1.23 × 10⁵)", 
+        value=st.session_state.get('sci_notation_enabled', False), key="sci_notation_toggle_widget",
+        help="Toggles number display and available factor options. Division (÷) is hidden in scientific mode; use multiplication by negative powers of 10 (e.g., × 10⁻¹)."
+    )
+    sci_on = st.session_state.sci_notation_enabled 
+    st.markdown("Build the conversion step-by-step. Click an item in your calculation to remove it.")
+    timer.lap("title_and_toggle")
+
+    if not st.session_state.game_initialized: generate_question() 
+    cqd = st.session_state.get('current_question_data')
+    timer.lap("question_generation")
+    
+    if cqd is not None:
+        start_val_disp_q = format_number_display(cqd.start_value_raw, sci_on)
+        st.markdown(f"### Convert: {start_val_disp_q} {cqd.from_unit} to {cqd.to_unit}", unsafe_allow_html=True)
+    else: 
+        st.markdown("### Loading question...")
+        if st.button("Start / Reload Question", key="manual_start_btn_main_top_v8"): 
+            generate_question(); st.rerun()
+    timer.count_widgets(1 if cqd is not None else 2) # Toggle (+ manual start button)
+    timer.lap("question_header")
+
+    calculation_area()
+    timer.lap("calculation_area")
+    worksheet_export_panel()
+    timer.lap("worksheet_export")
+    timer.finish()
+    if profiling_enabled(): render_profiling_panel()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,55 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+import attempt_log
+from attempt_log import AttemptLog, category_accuracy
+
+@pytest.fixture
+def log_path(tmp_path):
+    return os.path.join(tmp_path, "attempts.sqlite3")
+
+def _record(log, category="length", is_correct=True, start_value=2.5):
+    log.record("session", category, "km", "m", start_value, "× 1000", "ok", is_correct, 12.5)
+
+def test_records_are_written_and_summarised(log_path):
+    log = AttemptLog(log_path, batch_size=2)
+    for is_correct in (True, False, True): _record(log, is_correct=is_correct)
+    _record(log, category="mass")
+    assert log.flush(10)
+    log.close()
+    assert category_accuracy(log_path) == [("length", 3, 2, 2 / 3), ("mass", 1, 1, 1.0)]
+    assert category_accuracy(log_path, since=time.time() - 60) == category_accuracy(log_path)
+    assert category_accuracy(log_path, since=time.time() + 60) == []
+
+def test_failed_batch_does_not_stop_the_writer(log_path, caplog):
+    log = AttemptLog(log_path, batch_size=10)
+    _record(log)
+    _record(log, start_value=object()) # sqlite3 can't bind this, so the whole batch fails
+    assert log.flush(10) # Used to block forever: the writer thread had died with _writing set
+    assert log.failed == 2
+    assert "Could not write 2 attempts" in caplog.text
+    _record(log)
+    assert log.flush(10)
+    started = time.monotonic()
+    log.close()
+    assert time.monotonic() - started < attempt_log.CLOSE_TIMEOUT
+    assert category_accuracy(log_path) == [("length", 1, 1, 1.0)]
+
+def test_record_after_close_is_dropped(log_path):
+    log = AttemptLog(log_path)
+    log.close()
+    _record(log)
+    assert log.dropped == 1
+    assert category_accuracy(log_path) == []
+
+def test_windowed_accuracy_without_the_recent_index(log_path):
+    log = AttemptLog(log_path)
+    _record(log)
+    log.close()
+    with sqlite3.connect(log_path) as connection: connection.execute("DROP INDEX attempts_recent_category_correct")
+    assert category_accuracy(log_path, since=time.time() - 60) == [("length", 1, 1, 1.0)]
+    with sqlite3.connect(log_path) as connection: # A report must not rebuild the index under the live writer
+        assert connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'attempts_recent_category_correct'").fetchone() is None
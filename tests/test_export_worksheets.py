@@ -0,0 +1,48 @@
+import re
+from decimal import Decimal
+
+import pytest
+
+import conversion_core as core
+import export_worksheets
+
+_FROM_SUPERSCRIPT = str.maketrans("⁰¹²³⁴⁵⁶⁷⁸⁹⁻⁺", "0123456789-+")
+_QUESTION = re.compile(r"Convert (.+) (\S+) to (\S+)")
+_PAIRS = {(c["from"], c["to"]): c for c in core.FLAT_CONVERSION_PAIRS}
+
+def _parse_label(label):
+    # Exact value of a printed number: "368 040.5", "3.68 × 10²", "10⁻³" or "4.4"
+    mantissa, times, power = label.partition(" × ")
+    if times: return Decimal(mantissa).scaleb(int(power[2:].translate(_FROM_SUPERSCRIPT)))
+    if label != label.translate(_FROM_SUPERSCRIPT): return Decimal(1).scaleb(int(label[2:].translate(_FROM_SUPERSCRIPT)))
+    return Decimal(label.replace(" ", ""))
+
+@pytest.mark.parametrize("sci", [False, True])
+def test_answer_key_matches_the_printed_question(sci):
+    for row in export_worksheets.worksheet_rows(5000, sci, seed=7, chunk_size=1000):
+        start_label, from_unit, to_unit = _QUESTION.fullmatch(row["question"]).groups()
+        exponent = _PAIRS[(from_unit, to_unit)]["exponent"]
+        expected = core.format_number_display(float(_parse_label(start_label).scaleb(exponent)), sci)
+        assert row["answer"] == f"{expected} {to_unit}", row["question"]
+        assert _parse_label(start_label) > 0
+
+def test_pdf_cross_reference_and_page_count():
+    pdf = export_worksheets.worksheet_bytes(60, "pdf", seed=3, questions_per_sheet=25)
+    assert pdf.startswith(b"%PDF-1.4\n") and pdf.endswith(b"%%EOF\n")
+    xref_offset = int(re.search(rb"startxref\n(\d+)\n", pdf).group(1))
+    assert pdf[xref_offset:].startswith(b"xref\n")
+    object_count = int(re.match(rb"xref\n0 (\d+)\n", pdf[xref_offset:]).group(1))
+    offsets = [int(offset) for offset in re.findall(rb"(\d{10}) 00000 n \n", pdf[xref_offset:])]
+    assert len(offsets) == object_count - 1
+    for object_id, offset in enumerate(offsets, 1):
+        assert pdf[offset:].startswith(b"%d 0 obj\n" % object_id)
+    # 3 sheets (25, 25, 10 questions), each a question page and an answer page
+    page_count = int(re.search(rb"/Count (\d+)", pdf).group(1))
+    assert page_count == len(re.findall(rb"/Type /Page /Parent", pdf)) == 6
+    kids = [int(kid) for kid in re.findall(rb"(\d+) 0 R", re.search(rb"/Kids \[([^\]]*)\]", pdf).group(1))]
+    assert all(pdf[offsets[kid - 1]:].startswith(b"%d 0 obj\n<< /Type /Page " % kid) for kid in kids)
+
+def test_pdf_pages_split_long_sheets():
+    lines_per_page = export_worksheets.PDF_LINES_PER_PAGE - 2 # Heading and blank line
+    pdf = export_worksheets.worksheet_bytes(lines_per_page + 1, "pdf", seed=3, questions_per_sheet=lines_per_page + 1)
+    assert int(re.search(rb"/Count (\d+)", pdf).group(1)) == 4 # Questions and answers each need two pages
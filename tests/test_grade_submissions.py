@@ -0,0 +1,32 @@
+import io
+import json
+
+import grade_submissions
+
+def _grade(text, file_format, chunk_size=3):
+    return list(grade_submissions.grade_stream(grade_submissions.read_submissions(io.StringIO(text), file_format), chunk_size))
+
+def test_malformed_jsonl_rows_get_invalid_row():
+    rows = [
+        {"id": "ok", "start_value_raw": 2.5, "correct_answer_raw": 2500, "sequence": ["×", 1000]},
+        {"id": "missing", "correct_answer_raw": 2500, "sequence": ["×", 1000]},
+        {"id": "text", "start_value_raw": "abc", "correct_answer_raw": 2500, "sequence": ["×", 1000]},
+        {"id": "string sequence", "start_value_raw": 2.5, "correct_answer_raw": 2500, "sequence": "× 1000"},
+        {"id": "number sequence", "start_value_raw": 2.5, "correct_answer_raw": 2500, "sequence": 7},
+        {"id": "nan", "start_value_raw": 2.5, "correct_answer_raw": "nan", "sequence": ["×", 1000]},
+    ]
+    text = "\n".join(json.dumps(row) for row in rows) + "\n{not json\n[1, 2]\n"
+    results = _grade(text, "jsonl")
+    assert [(r["id"], r["status"]) for r in results] == [
+        ("ok", "ok"), ("missing", "invalid_row"), ("text", "invalid_row"), ("string sequence", "ok"),
+        ("number sequence", "invalid_row"), ("nan", "invalid_row"), (None, "invalid_row"), (None, "invalid_row")]
+    assert results[3]["student_result_raw"] == 2500.0 and results[3]["is_correct"] is True
+    assert results[1]["error"] == "missing start_value_raw"
+    assert results[6]["error"].startswith("line 7: invalid JSON") and results[7]["error"] == "line 8: not a JSON object"
+    assert all(r["error"] is None for r in results if r["status"] != "invalid_row")
+
+def test_short_csv_rows_get_invalid_row():
+    text = "id,start_value_raw,correct_answer_raw,sequence\nc1,2.5,2500,× 1000\nc2,2.5\nc3,,2500,× 1000\nc4,2.5,2500,× 10 × 100\nc5,2.5,2500\n"
+    results = _grade(text, "csv", chunk_size=2)
+    assert [(r["id"], r["status"], r["is_correct"]) for r in results] == [
+        ("c1", "ok", True), ("c2", "invalid_row", False), ("c3", "invalid_row", False), ("c4", "ok", True), ("c5", "empty", False)]
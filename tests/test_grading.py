@@ -0,0 +1,110 @@
+import math
+import random
+from decimal import Decimal
+
+import pytest
+
+import conversion_core as core
+
+# --- grade_sequence / grade_sequences_batch ---
+STATUS_CASES = [
+    ([], "empty"),
+    (["×"], "incomplete"),
+    (["×", 10, "÷"], "incomplete"),
+    (["×", "abc"], "invalid_factor"),
+    (["×", None], "invalid_factor"),
+    (["×", [1000]], "invalid_factor"),
+    (["+", "abc"], "invalid_factor"), # The factor is checked before the operation
+    (["÷", 0], "div_by_zero"),
+    (["+", 10], "invalid_op"),
+    (["×", 10, "-", 10], "invalid_op"),
+    (["×", 1000], "ok"),
+    (["÷", 10, "×", 100], "ok"),
+]
+
+@pytest.mark.parametrize("sequence, status", STATUS_CASES)
+def test_statuses_match_between_scalar_and_batch(sequence, status):
+    scalar_status, scalar_result, scalar_correct = core.grade_sequence(2.5, 2500.0, sequence)
+    batch = core.grade_sequences_batch([2.5], [2500.0], [sequence])
+    assert scalar_status == batch["status"][0] == status
+    if status == "ok":
+        assert batch["student_result_raw"][0] == pytest.approx(scalar_result, rel=1e-12)
+        assert bool(batch["is_correct"][0]) == scalar_correct
+    else:
+        assert scalar_result is None and math.isnan(batch["student_result_raw"][0])
+        assert not batch["is_correct"][0] and not scalar_correct # None for "empty", False otherwise
+
+@pytest.mark.parametrize("student, correct, expected", [
+    (1.0, 1.0 + 0.9e-7, True), # Inside the relative tolerance
+    (1.0, 1.0 + 1.1e-7, False),
+    (1e12, 1e12 * (1 + 0.9e-7), True),
+    (0.0, 0.9e-9, True), # Near zero only the absolute tolerance applies
+    (0.0, 1.1e-9, False),
+    (1e-12, 2e-12, True),
+    (100.0, 100.0 * (1 - 0.99e-7), True), # Symmetric: scaled by the larger of the two
+])
+def test_isclose_rule_matches_between_scalar_and_batch(student, correct, expected):
+    sequence = ["×", 1] # Result equals the start value
+    assert core.grade_sequence(student, correct, sequence)[2] is expected
+    assert bool(core.grade_sequences_batch([student], [correct], [sequence])["is_correct"][0]) is expected
+    assert bool(core.grade_sequences_batch([correct], [student], [sequence])["is_correct"][0]) is expected
+
+def test_batch_matches_scalar_on_generated_questions():
+    rng = random.Random(3)
+    batch = core.generate_question_batch(2000, seed=3)
+    tokens = ["×", "÷", "+", 10, 100, 1000, 0, 0.1, "x"]
+    sequences = [[rng.choice(tokens) for _ in range(rng.choice([0, 1, 2, 4, 6]))] for _ in range(2000)]
+    graded = core.grade_sequences_batch(batch["start_value_raw"], batch["correct_answer_raw"], sequences)
+    for row, sequence in enumerate(sequences):
+        status, result, is_correct = core.grade_sequence(float(batch["start_value_raw"][row]), float(batch["correct_answer_raw"][row]), sequence)
+        assert graded["status"][row] == status
+        assert bool(graded["is_correct"][row]) == bool(is_correct)
+        if status == "ok": assert graded["student_result_raw"][row] == pytest.approx(result, rel=1e-12)
+
+# --- Exact exponent path (grade_step_codes) ---
+_PAIRS = {(c["from"], c["to"]): i for i, c in enumerate(core.FLAT_CONVERSION_PAIRS)}
+
+def test_each_conversion_is_asked_in_one_category():
+    assert len(_PAIRS) == len(core.FLAT_CONVERSION_PAIRS) # mL -> L is listed under volume_liquid, not derived again under volume_metric_cubed
+
+def _question(from_unit, to_unit, start_value_raw):
+    pair_index = _PAIRS[(from_unit, to_unit)]
+    return core.question_from_batch({"pair_index": [pair_index], "start_value_raw": [start_value_raw]}, 0)
+
+def _codes(*steps):
+    return core.new_step_sequence(core.encode_step(step) for step in steps)
+
+def test_exact_path_shifts_decimals_exactly():
+    assert 1.1 / 10 / 10 != 0.011 # A float replay picks up a rounding error...
+    status, result, is_correct = core.grade_step_codes(_question("cm", "m", 1.1), _codes("÷", 10, "÷", 10))
+    assert (status, result, is_correct) == ("ok", float(Decimal("1.1").scaleb(-2)), True) # ...the exact path does not
+    assert result == 0.011
+
+def test_exact_path_compares_exponents():
+    question = _question("km", "m", 2.5)
+    assert core.grade_step_codes(question, _codes("×", 10, "×", 100))[2] is True
+    assert core.grade_step_codes(question, _codes("×", 100, "×", 100, "÷", 10))[2] is True
+    assert core.grade_step_codes(question, _codes("×", 100))[2] is False
+    assert core.grade_step_codes(question, _codes("×", 0.001))[2] is False
+
+def test_exact_path_statuses():
+    question = _question("km", "m", 2.5)
+    assert core.grade_step_codes(question, _codes()) == ("empty", None, None)
+    assert core.grade_step_codes(question, _codes("×")) == ("incomplete", None, False)
+    assert core.grade_step_codes(question, _codes("×", "÷")) == ("invalid_factor", None, False)
+    assert core.grade_step_codes(question, _codes(10, 10)) == ("invalid_op", None, False)
+
+def test_power_of_ten_exponent():
+    assert [core.power_of_ten_exponent(v) for v in (1, 10, 1000, 0.001, "1e-3", 1e12)] == [0, 1, 3, -3, -3, 12]
+    assert [core.power_of_ten_exponent(v) for v in (0, -10, 20, 0.5, "abc", None, float("inf"))] == [None] * 7
+
+def test_grade_step_codes_matches_grade_sequence():
+    rng = random.Random(5)
+    batch = core.generate_question_batch(500, seed=5)
+    for row in range(500):
+        question = core.question_from_batch(batch, row)
+        codes = core.new_step_sequence(rng.randrange(len(core.STEP_TOKENS)) for _ in range(rng.choice([0, 1, 2, 4])))
+        status, result, is_correct = core.grade_step_codes(question, codes)
+        expected_status, expected_result, expected_correct = core.grade_sequence(question.start_value_raw, question.correct_answer_raw, core.decode_sequence(codes))
+        assert (status, is_correct) == (expected_status, expected_correct)
+        if status == "ok": assert result == pytest.approx(expected_result, rel=1e-12)
@@ -0,0 +1,38 @@
+import random
+from itertools import accumulate
+
+import pytest
+
+import conversion_core as core
+
+# --- Fenwick-tree sampler ---
+def _reference_sample(scheduler, uniform_draw):
+    # Linear scan over the cumulative weights: first pair whose range contains the draw
+    cumulative = list(accumulate(scheduler.weight(i) for i in range(len(core.FLAT_CONVERSION_PAIRS))))
+    target = uniform_draw * cumulative[-1]
+    return next(i for i, total in enumerate(cumulative) if total > target), cumulative
+
+def test_sampler_matches_linear_scan_after_updates():
+    rng = random.Random(11)
+    scheduler = core.MasteryScheduler()
+    for _ in range(300): scheduler.update(rng.randrange(len(core.FLAT_CONVERSION_PAIRS)), rng.random() < 0.6)
+    for _ in range(2000):
+        uniform_draw = rng.random()
+        expected, cumulative = _reference_sample(scheduler, uniform_draw)
+        if min(abs(uniform_draw * cumulative[-1] - total) for total in cumulative) < 1e-12: continue # Float tie at a boundary
+        assert scheduler.sample(uniform_draw) == expected
+
+def test_sampler_shifts_toward_missed_conversions():
+    scheduler = core.MasteryScheduler()
+    before = scheduler.weight(4)
+    for _ in range(5): scheduler.update(4, False)
+    for _ in range(5): scheduler.update(5, True)
+    assert scheduler.weight(4) > before > scheduler.weight(5) > 0
+    assert scheduler.error_rate(4) > 0.9
+
+def test_sampler_respects_category_weights():
+    only = core.CATEGORY_NAMES[1]
+    scheduler = core.MasteryScheduler({only: 1})
+    draws = [scheduler.sample(u / 1000) for u in range(1000)] + [scheduler.sample(1 - 1e-16)]
+    assert {core.CompactQuestion(pair_index, 1.0, 1.0).category for pair_index in draws} == {only}
+    with pytest.raises(ValueError): core.MasteryScheduler({only: 0})
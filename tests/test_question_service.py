@@ -0,0 +1,104 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+
+import pytest
+
+import conversion_core as core
+from question_service import LocalQuestionService, QuestionService, QuestionServiceClient, QuestionServiceError
+
+BATCH_WINDOW_MS = 100 # Wide enough that concurrent test requests land in one batch
+
+def _serve(service, ready, running):
+    async def serve():
+        running["loop"], running["task"] = asyncio.get_running_loop(), asyncio.current_task()
+        try: await service.serve(ready)
+        except asyncio.CancelledError: pass
+    asyncio.run(serve()) # Also cancels the connection handlers still open at the end
+
+@pytest.fixture(scope="module")
+def server_path():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, ready, running = os.path.join(tmp, "question_service.sock"), threading.Event(), {}
+        thread = threading.Thread(target=_serve, args=(QuestionService(path, workers=1, batch_window_ms=BATCH_WINDOW_MS), ready, running), daemon=True)
+        thread.start()
+        assert ready.wait(30), "question service did not start"
+        yield path
+        running["loop"].call_soon_threadsafe(running["task"].cancel)
+        thread.join(30)
+        assert not os.path.exists(path) # serve() removes its socket on the way out
+
+@pytest.fixture(params=["local", "server"])
+def service(request):
+    service = LocalQuestionService(seed=1) if request.param == "local" else QuestionServiceClient(request.getfixturevalue("server_path"))
+    yield service
+    service.close()
+
+def _solution_codes(question):
+    return core.new_step_sequence(core.encode_step(token) for op, factor, _ in core.step_solution(question.pair_index, False) for token in (op, factor))
+
+def test_generate_and_grade(service):
+    questions = service.generate(count=5, pair_index=7)
+    assert len(questions) == 5 and {q.pair_index for q in questions} == {7}
+    for question in questions:
+        assert question.correct_answer_raw == pytest.approx(question.start_value_raw * float(core.FLAT_CONVERSION_PAIRS[7]["ratio"]))
+        assert tuple(service.grade(question, _solution_codes(question))) == core.grade_step_codes(question, _solution_codes(question))
+        assert service.grade(question, _solution_codes(question))[2] is True
+    assert tuple(service.grade(questions[0], [])) == ("empty", None, None)
+
+def test_generate_honours_category_weights(service):
+    only = core.CATEGORY_NAMES[2]
+    assert {q.category for q in service.generate(count=200, category_weights={only: 1})} == {only}
+
+@pytest.mark.parametrize("request_kwargs, message", [
+    ({"count": 0}, "count must be between"),
+    ({"pair_index": len(core.FLAT_CONVERSION_PAIRS)}, "no conversion"),
+    ({"category_weights": {"length": 0}}, "Invalid category weights"),
+])
+def test_generate_errors(server_path, request_kwargs, message):
+    client = QuestionServiceClient(server_path)
+    with pytest.raises(QuestionServiceError, match=message): client.generate(**request_kwargs)
+    assert len(client.generate()) == 1 # The connection is still usable after an error
+    client.close()
+
+def test_grade_errors(server_path):
+    client = QuestionServiceClient(server_path)
+    question = client.generate(pair_index=3)[0]
+    with pytest.raises(QuestionServiceError, match="unknown step code"): client.grade(question, [len(core.STEP_TOKENS)])
+    with pytest.raises(QuestionServiceError, match="no conversion"): client.grade(core.CompactQuestion(-1, 1.0, 1.0), [])
+    client.close()
+
+def test_malformed_requests_get_error_responses(server_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock, sock.makefile("rb") as responses:
+        sock.settimeout(10)
+        sock.connect(server_path)
+        for line in (b"{not json\n", b'{"op": "shutdown"}\n', b'{"op": "grade", "codes": []}\n', b'{"op": "stats"}\n'):
+            sock.sendall(line)
+            response = json.loads(responses.readline())
+            assert ("result" if line.startswith(b'{"op": "stats"') else "error") in response
+    client = QuestionServiceClient(server_path)
+    assert client.stats()["requests"]["error"] >= 3
+    client.close()
+
+def test_concurrent_requests_are_batched(server_path):
+    client = QuestionServiceClient(server_path)
+    before = client.stats()["batches"]["generate"]
+    results, barrier = [None] * 16, threading.Barrier(16)
+    def ask(i):
+        barrier.wait()
+        results[i] = client.generate(count=2, pair_index=i)
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(16)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    after = client.stats()["batches"]["generate"]
+    client.close()
+    assert [{q.pair_index for q in questions} for questions in results] == [{i} for i in range(16)]
+    assert after["items"] - before["items"] == 16
+    assert after["batches"] - before["batches"] < 16 # Requests within the window share a batch
+
+def test_unreachable_service_raises():
+    with pytest.raises(QuestionServiceError, match="unavailable"):
+        QuestionServiceClient(os.path.join(tempfile.gettempdir(), "no_such_question_service.sock")).generate()
@@ -0,0 +1,27 @@
+import math
+
+import pytest
+
+import conversion_core as core
+
+# --- Optimal step solver ---
+@pytest.mark.parametrize("sci", [False, True])
+def test_step_solutions_are_shortest_and_correct(sci):
+    operations, factors = core.AVAILABLE_STEPS[sci]
+    available = {(op, factor) for _, op in operations for _, factor in factors}
+    largest_step = max(abs(core.power_of_ten_exponent(factor)) for _, factor in factors)
+    for pair_index, conversion in enumerate(core.FLAT_CONVERSION_PAIRS):
+        solution = core.step_solution(pair_index, sci)
+        assert solution is not None
+        assert all((op, factor) in available for op, factor, _ in solution)
+        assert sum(exponent for _, _, exponent in solution) == conversion["exponent"]
+        # Same-size units (mL -> cm³) can't be submitted as no steps: the shortest there-and-back instead
+        assert len(solution) == (math.ceil(abs(conversion["exponent"]) / largest_step) or 2)
+        question = core.CompactQuestion(pair_index, 2.5, 2.5 * float(conversion["ratio"]))
+        codes = core.new_step_sequence(core.encode_step(token) for op, factor, _ in solution for token in (op, factor))
+        assert core.grade_step_codes(question, codes)[2] is True
+
+def test_step_solution_prefers_the_conversions_own_step():
+    pairs = {(c["from"], c["to"]): i for i, c in enumerate(core.FLAT_CONVERSION_PAIRS)}
+    assert [(op, factor) for op, factor, _ in core.step_solution(pairs[("m²", "cm²")], False)] == [("×", 100), ("×", 100)]
+    assert [(op, factor) for op, factor, _ in core.step_solution(pairs[("km", "cm")], False)] == [("×", 1000), ("×", 100)]